@@ -1,40 +1,243 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import argparse
+import json
 import os
+import random
+import threading
 import time
+from game_store import DirectoryStore, ShardedZipStore
 
 OUTPUT_DIR = './Output/'
+BASE_URL = 'http://gokifu.com/'
+PAGE_COUNT = 2582
+CHECKPOINT_FILE = './harvest_checkpoint.json'
 
-def get_game_list(page_number):
-    page = requests.get(f'http://gokifu.com/index.php?p={page_number}')
-    if page.status_code != 200:
-        raise RuntimeError(f'Got {page.status_code} on page {page_number}')
-    soup = BeautifulSoup(page.content, 'html.parser')
-    games = soup.find_all(class_='game_type')
-    links = []
-    for game in games[1:]:
-        links.append(game.find_all('a')[1].attrs['href'])
-    return links
-
-
-for page_number in range(2582):
-    print(f'Downloading page {page_number}...')
-    links = get_game_list(page_number)
-    for link in links:
-        file_name = link.split('/')[-1]
-        full_file_path = f'{OUTPUT_DIR}{file_name}'
-        if os.path.exists(full_file_path):
-            print(f'Skipping {full_file_path}')
-            continue
-
-        print(f'Downloading {file_name}')
-        page = requests.get(link)
-        if page.status_code != 200:
-            raise RuntimeError(f'Got {page.status_code} on page {page_number} file {file_name}')
-        with open(full_file_path, 'w') as fp:
-            fp.write(page.content.decode())
-        time.sleep(0.5)
-
-print('Done.')
+# Responses worth retrying, anything else that is not 200 fails at once
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 
+class TokenBucket(object):
+    '''
+    Token bucket rate limiter shared by all download threads.
+    Allows rate requests per second on average, with bursts of up to capacity requests.
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Block until a token is available, then take it'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Harvester(object):
+    '''
+    Downloads the index pages and SGF files of the site. Index pages are walked in order on the calling
+    thread, SGF files are downloaded by a pool of threads sharing one pooled HTTP session and one rate limit.
+    Harvested file names and the first page that is not fully harvested are kept in a checkpoint file.
+    Games are written to store, a DirectoryStore or ShardedZipStore from game_store.
+    '''
+    def __init__(self, store, base_url=BASE_URL, workers=4, rate=4.0, retries=5, backoff=1.0,
+                 timeout=30, checkpoint_file=CHECKPOINT_FILE):
+        self.store = store
+        self.base_url = base_url
+        self.checkpoint_file = checkpoint_file
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        # One connection per download worker plus one for the index walk of the main thread
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers + 1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Bounds the downloads queued on the pool, so the index walk cannot run far ahead of the downloads
+        self.in_flight = threading.BoundedSemaphore(workers * 2)
+        self.stats_lock = threading.Lock()
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = []
+        # Checkpoint state, page_pending[page_number] counts the downloads of a page that have not finished yet
+        self.harvested = set()
+        self.next_page = 0
+        self.page_pending = {}
+        self.incomplete_pages = set()
+        self.load_checkpoint()
+
+    def load_checkpoint(self):
+        '''
+        Load the checkpoint and the names in the store once, so the per-link check is a set lookup
+        '''
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as fp:
+                checkpoint = json.load(fp)
+            self.harvested.update(checkpoint['files'])
+            self.next_page = checkpoint['next_page']
+        self.harvested.update(self.store.names())
+
+    def save_checkpoint(self, walked_page):
+        '''
+        Write the checkpoint. next_page is the first page that still has downloads pending or failed,
+        or else the page after walked_page, but never earlier than the next_page of the loaded checkpoint
+        so a short --new-only walk does not rewind a full harvest in progress.
+        '''
+        with self.stats_lock:
+            unfinished = [page for page, pending in self.page_pending.items() if pending > 0]
+            next_page = min(unfinished + list(self.incomplete_pages) + [max(walked_page + 1, self.next_page)])
+            checkpoint = dict(next_page=next_page, files=sorted(self.harvested))
+        # Every game in the checkpoint must be durable in the store. A game is added to the store before its name
+        # is added to harvested, so flushing after the copy covers every name in it; games stored since are
+        # recorded by the next checkpoint.
+        self.store.flush()
+        with open(self.checkpoint_file + '.tmp', 'w') as fp:
+            json.dump(checkpoint, fp)
+        os.replace(self.checkpoint_file + '.tmp', self.checkpoint_file)
+
+    def fetch(self, url):
+        '''
+        GET url through the rate limit, retrying connection errors and retryable status codes with
+        exponential backoff. A Retry-After header from the server takes precedence over the backoff.
+        :return: requests.Response with status 200
+        :raises RuntimeError: non retryable status, or retries exhausted
+        '''
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            try:
+                page = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                problem = f'{type(e).__name__}'
+            else:
+                if page.status_code == 200:
+                    return page
+                if page.status_code not in RETRY_STATUS_CODES:
+                    raise RuntimeError(f'Got {page.status_code} on {url}')
+                problem = f'status {page.status_code}'
+                retry_after = page.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = int(retry_after)
+            if attempt < self.retries:
+                print(f'{problem} on {url}, retrying in {delay:.1f}s')
+                time.sleep(delay)
+        raise RuntimeError(f'Gave up on {url} after {self.retries + 1} attempts ({problem})')
+
+    def get_game_list(self, page_number):
+        page = self.fetch(urljoin(self.base_url, f'index.php?p={page_number}'))
+        soup = BeautifulSoup(page.content, 'html.parser')
+        games = soup.find_all(class_='game_type')
+        links = []
+        for game in games[1:]:
+            links.append(urljoin(self.base_url, game.find_all('a')[1].attrs['href']))
+        return links
+
+    def download_game(self, page_number, link, file_name):
+        try:
+            print(f'Downloading {file_name}')
+            try:
+                page = self.fetch(link)
+            except RuntimeError as e:
+                print(e)
+                with self.stats_lock:
+                    self.failed.append(link)
+                    self.incomplete_pages.add(page_number)
+                return
+            self.store.add(file_name, page.content)
+            with self.stats_lock:
+                self.downloaded += 1
+                self.harvested.add(file_name)
+        finally:
+            with self.stats_lock:
+                self.page_pending[page_number] -= 1
+            self.in_flight.release()
+
+    def run(self, pages, new_only=False, checkpoint_every=25):
+        '''
+        Walk the index pages in order and download every game not harvested yet
+        :param new_only: stop at the first page where every game is already harvested. The site lists
+            newest games first, so this picks up the games added since the last run.
+        '''
+        page_number = -1
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for walked, page_number in enumerate(pages, start=1):
+                    print(f'Downloading page {page_number}...')
+                    try:
+                        links = self.get_game_list(page_number)
+                    except RuntimeError as e:
+                        print(e)
+                        with self.stats_lock:
+                            self.failed.append(f'page {page_number}')
+                            self.incomplete_pages.add(page_number)
+                        continue
+                    with self.stats_lock:
+                        self.page_pending[page_number] = 0
+                    submitted = 0
+                    for link in links:
+                        file_name = link.split('/')[-1]
+                        if file_name in self.harvested:
+                            self.skipped += 1
+                            continue
+                        self.in_flight.acquire()
+                        with self.stats_lock:
+                            self.page_pending[page_number] += 1
+                        pool.submit(self.download_game, page_number, link, file_name)
+                        submitted += 1
+                    if new_only and submitted == 0:
+                        print(f'Every game on page {page_number} is already harvested, stopping')
+                        break
+                    if walked % checkpoint_every == 0:
+                        self.save_checkpoint(page_number)
+        finally:
+            # Reached after the pool has finished or abandoned its downloads, also on Ctrl-C
+            if page_number >= 0:
+                self.save_checkpoint(page_number)
+        print(f'Downloaded {self.downloaded}, skipped {self.skipped}, failed {len(self.failed)}')
+        for failure in self.failed:
+            print(f'   failed: {failure}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download SGF game records from GoKifu.Com')
+    parser.add_argument('--base-url', default=BASE_URL, help='site to harvest, point at a local server for testing')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='directory to write one .sgf file per game to')
+    parser.add_argument('--archive', help='directory of zip shards to append games to instead of --output-dir, '
+                                          'readable by 02_generate_sql_script_from_tgz.py --input')
+    parser.add_argument('--pages', type=int, default=PAGE_COUNT, help='number of index pages to walk')
+    parser.add_argument('--workers', type=int, default=4, help='number of downloads in flight')
+    parser.add_argument('--rate', type=float, default=4.0, help='maximum requests per second')
+    parser.add_argument('--retries', type=int, default=5, help='retries per request before giving up on it')
+    parser.add_argument('--backoff', type=float, default=1.0, help='base delay in seconds between retries')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help='checkpoint of harvested pages and files')
+    parser.add_argument('--resume', action='store_true',
+                        help='start at the first page the checkpoint records as not fully harvested')
+    parser.add_argument('--new-only', action='store_true',
+                        help='walk from the newest page and stop at the first page with nothing new')
+    args = parser.parse_args()
+
+    if args.archive:
+        store = ShardedZipStore(args.archive, remove_partial=True)
+    else:
+        store = DirectoryStore(args.output_dir)
+    harvester = Harvester(store, args.base_url, args.workers, args.rate, args.retries, args.backoff,
+                          checkpoint_file=args.checkpoint)
+    first_page = harvester.next_page if args.resume else 0
+    harvester.run(range(first_page, args.pages), new_only=args.new_only)
+
+    print('Done.')
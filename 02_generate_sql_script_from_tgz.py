@@ -1,8 +1,29 @@
-import re
-import tarfile
 import os
-import sgf
+import re
+import time
+import cProfile
+import argparse
+import multiprocessing
+import tempfile
+import hashlib
+import json
+import struct
+import shutil
+import numpy as np
+from collections import deque
 from sgf_wrapper import SGFWrapper
+from game_record import GameRecord
+from event_classifier import COUNTRIES, country_code_to_id, classify_event
+from sql_loader import DatabaseLoader, SQLiteLoader, connect_from_env
+from position_index import PositionIndex, DEFAULT_MOVES
+from opening_tree import OpeningTree, DEFAULT_MOVES as DEFAULT_OPENING_MOVES, DEFAULT_MIN_GAMES
+from go_board import replay_games, LEGAL, ERROR_NAMES, DEFAULT_BATCH_SIZE
+from player_stats import PlayerStats, DEFAULT_MIN_HEAD_TO_HEAD_GAMES
+from ratings import RatingEngine, GAME_RESULT_DTYPE
+from player_names import PlayerNames, load_aliases
+from import_report import ImportReport
+from game_store import open_game_source
+from sgf_parser_check import time_parsers
 from datetime import datetime
 
 ##############################################################################
@@ -10,53 +31,109 @@ from datetime import datetime
 
 DATABASE_NAME = 'BGO'
 
-# List of countries with code, abbreviation, full name
-COUNTRIES = [
-    (0, 'none', 'None'),
-    (1, 'cn', 'China'),
-    (2, 'kr', 'Korea'),
-    (3, 'jp', 'Japan'),
-    (4, 'tw', 'Taiwan'),
-]
-
-# Maps country full names to abbreviations
-COUNTRY_NAME_TO_ABBR = {
-    'Japanese': 'jp',
-    'Chinese': 'cn',
-    'Korean': 'kr',
-    'Taiwan': 'tw',
+# CREATE TABLE statements, in load order
+TABLE_DDL = {
+    'Countries': ('CREATE TABLE Countries (\n'
+                  '   Id INT PRIMARY KEY IDENTITY,\n'
+                  '   Code NVARCHAR(5),\n'
+                  '   Name NVARCHAR(30)\n'
+                  ')\n'),
+    'BaseEvents': ('CREATE TABLE BaseEvents (\n'
+                   '   Id INT PRIMARY KEY IDENTITY,\n'
+                   '   Name NVARCHAR(100) NOT NULL,\n'
+                   '   CountryId INT FOREIGN KEY REFERENCES Countries(Id)\n'
+                   ')'),
+    'Events': ('CREATE TABLE Events (\n'
+               '   Id INT PRIMARY KEY IDENTITY,\n'
+               '   Name NVARCHAR(100) NOT NULL,\n'
+               '   Number INT NOT NULL,\n'
+               '   BaseEventId INT FOREIGN KEY REFERENCES BaseEvents(Id)\n'
+               ')'),
+    'Players': ('CREATE TABLE Players (\n'
+                '   Id INT PRIMARY KEY IDENTITY,\n'
+                '   Name NVARCHAR(100) NOT NULL,\n'
+                '   CountryId INT FOREIGN KEY REFERENCES Countries(Id)'
+                ')'),
+    'Games': ('CREATE TABLE Games (\n'
+              '   Id INT PRIMARY KEY IDENTITY,\n'
+              '   CountryId INT FOREIGN KEY REFERENCES Countries(Id),\n'
+              '   BlackId INT FOREIGN KEY REFERENCES Players(Id),\n'
+              '   BlackRank INT NOT NULL,\n'
+              '   WhiteId INT FOREIGN KEY REFERENCES Players(Id),\n'
+              '   WhiteRank INT NOT NULL,\n'
+              '   EventsID INT FOREIGN KEY REFERENCES Events(Id),\n'
+              '   Event NVARCHAR(100),\n'
+              '   Round NVARCHAR(100),\n'
+              '   Place NVARCHAR(100),\n'
+              '   Result NVARCHAR(25) NOT NULL,\n'
+              '   WhoWonInt INT NOT NULL,\n'
+              '   Date DATE NOT NULL,\n'
+              '   Moves VARBINARY(2048) NOT NULL\n'
+              ')'),
+    'PlayerStats': ('CREATE TABLE PlayerStats (\n'
+                    '   PlayerId INT FOREIGN KEY REFERENCES Players(Id),\n'
+                    '   Category NVARCHAR(16) NOT NULL,\n'
+                    '   Value INT NOT NULL,\n'
+                    '   Games INT NOT NULL,\n'
+                    '   Wins INT NOT NULL,\n'
+                    '   Losses INT NOT NULL,\n'
+                    '   PRIMARY KEY (PlayerId, Category, Value)\n'
+                    ')'),
+    'HeadToHead': ('CREATE TABLE HeadToHead (\n'
+                   '   PlayerId INT FOREIGN KEY REFERENCES Players(Id),\n'
+                   '   OpponentId INT FOREIGN KEY REFERENCES Players(Id),\n'
+                   '   Games INT NOT NULL,\n'
+                   '   Wins INT NOT NULL,\n'
+                   '   Losses INT NOT NULL,\n'
+                   '   FirstDate DATE NOT NULL,\n'
+                   '   LastDate DATE NOT NULL,\n'
+                   '   PRIMARY KEY (PlayerId, OpponentId)\n'
+                   ')'),
+    'Ratings': ('CREATE TABLE Ratings (\n'
+                '   PlayerId INT PRIMARY KEY FOREIGN KEY REFERENCES Players(Id),\n'
+                '   Rating INT NOT NULL,\n'
+                '   Games INT NOT NULL,\n'
+                '   LastDate DATE NOT NULL\n'
+                ')'),
+    'RatingHistory': ('CREATE TABLE RatingHistory (\n'
+                      '   PlayerId INT FOREIGN KEY REFERENCES Players(Id),\n'
+                      '   Date DATE NOT NULL,\n'
+                      '   Rating INT NOT NULL,\n'
+                      '   Games INT NOT NULL,\n'
+                      '   PRIMARY KEY (PlayerId, Date)\n'
+                      ')'),
+    'ImportInfo': ('CREATE TABLE ImportInfo (\n'
+                   '   Generation BIGINT NOT NULL,\n'
+                   '   ImportedAt DATETIME NOT NULL,\n'
+                   '   Incremental BIT NOT NULL\n'
+                   ')'),
 }
 
-# Maps words in tournament name to host country
-TOURNAMENT_COUNTRY = {
-    'Samsung': 'kr',
-    'LG Cup': 'kr',
-    'Toyota': 'jp',
-    'Changqi': 'cn',
-    'Fujitsu': 'jp',
-    'Chunlan': 'cn',
-    'Nongshim': 'kr',
-    'Jeongganjang': 'kr',
-    'Zhonghuan': 'tw',
-    'Korea': 'jp',
-    'Nogshim': 'kr',
-    'Hungchang': 'kr',
-    'Kansai': 'jp',
-    'Hiroshima': 'jp',
-    'NHK': 'jp',
-    'Myeongin': 'kr',
-    'Haojue': 'cn',
-    'China': 'cn',
-    'Kangwon': 'kr',
-    'Daiwa-Shoken': 'jp',
-}
+# Secondary indexes, created after the inserts so the bulk load does not maintain them row by row
+#   (table, index name, key columns, estimated key bytes for the sizing summary)
+# Games indexes are ordered (Date DESC, Id DESC) for the newest first, keyset paged game listings of the
+# Flask server, their leading column also serves plain lookups and joins on that column.
+INDEXES = [
+    ('BaseEvents', 'IX_BaseEvents_CountryId', 'CountryId', 4),
+    ('Events', 'IX_Events_BaseEventId', 'BaseEventId', 4),
+    ('Players', 'IX_Players_CountryId', 'CountryId', 4),
+    ('Games', 'IX_Games_Date_Id', 'Date DESC, Id DESC', 7),
+    ('Games', 'IX_Games_EventsID_Date_Id', 'EventsID, Date DESC, Id DESC', 11),
+    ('Games', 'IX_Games_BlackId_Date_Id', 'BlackId, Date DESC, Id DESC', 11),
+    ('Games', 'IX_Games_WhiteId_Date_Id', 'WhiteId, Date DESC, Id DESC', 11),
+    ('Games', 'IX_Games_CountryId_Date_Id', 'CountryId, Date DESC, Id DESC', 11),
+]
+
+# Per row overhead of SQL Server data and index rows, for the sizing summary
+ROW_OVERHEAD_BYTES = 9
 
 ##############################################################################
 # Vars
 
-# players[name] = {player_id, country_id}
+# players[name] = {player_id, country_id}, keyed by the name player_names resolves the PB/PW name to
 last_player_id = 0
 players = {}
+player_names = PlayerNames()
 
 # tournaments['Japanese Meijin'] = {tournament_id, country_id}
 last_base_event_id = 0
@@ -66,28 +143,58 @@ base_events = {}
 last_event_id = 0
 events = {}
 
-#  Game list
+#  Game list of (GameRecord, country ID, event ID, black ID, white ID), or the spooled Games rows when streaming
+last_game_id = 0
 game_list = []
+game_spool = None
+# PositionIndex of the games imported, when --position-index is given
+position_index = None
+# OpeningTree of the games imported, when --opening-tree is given
+opening_tree = None
+# Results of the games of this run, appended to the game history next to the manifest, see history_path()
+game_results = None
+history_file = None
+# Win and loss counters of every game imported, saved next to the manifest, see stats_path()
+player_stats = PlayerStats()
+# RatingEngine of every game imported, its state is saved next to the manifest, see ratings_path()
+rating_engine = None
+min_head_to_head_games = DEFAULT_MIN_HEAD_TO_HEAD_GAMES
+
+# Import manifest, see load_manifest()
+#   manifest_members[member name] = sha1 of member content
+#   previous_ids = last IDs handed out by the run that wrote the manifest
+manifest_members = {}
+previous_ids = dict(player=0, base_event=0, event=0, game=0)
+previous_player_countries = {}
+
+# table_sizes[table] = [rows, estimated data bytes] of the rows written by this run, see count_row()
+table_sizes = {}
+
+# Timers and counters of this run, written by --report
+report = ImportReport()
+# Stages timed by parse_sgf_member(), in the order of the seconds it returns
+PARSE_STAGES = ('scan', 'record', 'validate', 'event')
+# Files the scanner and the sgf package are both timed on with --report, for the parse time the package would take
+PARSE_BASELINE_SAMPLE = 500
+# Detail dropped from RuntimeError messages to group rejects by reason, the exception text in brackets and moves
+_REASON_DETAIL = re.compile(r'\s*\[.*\]$|(?<=move) "[^"]*"')
+
+# Import generation, written to ImportInfo so the Flask server knows when to drop its response cache
+import_generation = int(time.time())
 
 ##############################################################################
 # Utility
 
-def country_code_to_id(code):
+def add_player(name, country):
     '''
-    Convert a country code 'jp' to id 3
+    :return: player ID of the player name resolves to
     '''
-    try:
-        return COUNTRIES[[o[1] for o in COUNTRIES].index(code)][0]
-    except (ValueError, IndexError):
-        raise RuntimeError(f'Could not find COUNTRIES[{code}]')
-
-
-def add_player(name, country):
     global last_player_id
     try:
         country_id = country_code_to_id(country if country != 'ja' else 'jp')
     except RuntimeError:
         country_id = 0
+    name = player_names.resolve(name)
     if name not in players:
         last_player_id += 1
         players[name] = dict(player_id=last_player_id, country_id=country_id)
@@ -95,6 +202,7 @@ def add_player(name, country):
         # If previous sighting had no country, update if this record has country
         if players[name]['country_id'] == 0 and country_id != 0:
             players[name]['country_id'] = country_id
+    return players[name]['player_id']
 
 
 def sql_escape(s):
@@ -112,38 +220,124 @@ def ordinal_from_int(i):
     return "%d%s" % (i, "tsnrhtdd"[(i // 10 % 10 != 1) * (i % 10 < 4) * i % 10::4])
 
 
-def decode_event(event):
+def count_row(table, fixed_bytes, *texts):
     '''
-    Possible event formats:
-        Ordinal   Country    Base Event Name
-            1st   Japanese   Meijin
-           22nd   Chinese    Mingren
-            5th              Asian TV Cup
-     Country Ord     base_name        event_name
-    ('jp', '1st', 'Japanese Meijin', '1st Japanese Meijin')
-    :return: (country_abbr, number, base_name, event_name)
+    Add one row to the sizing summary
+    :param fixed_bytes: bytes of the fixed size columns, 4 per INT and 3 per DATE
+    :param texts: NVARCHAR values, stored as 2 bytes per character plus 2 bytes of length,
+        or VARBINARY values, 1 byte per byte plus 2 bytes of length
     '''
-    r = re.search(r'(\d{1,2}(?:st|nd|rd|th))(.*)', event)
-    try:
-        event_name = r.group(0).strip()
-        number = r.group(1).strip()
-        number = int(''.join([ch for ch in number if str.isdigit(ch)]))
-        base_name = r.group(2).strip()
-        r2 = re.search(r'((?:Japanese|Chinese|Korean|Taiwan))', base_name)
-        try:
-            country = r2.group(1).strip()
-        except AttributeError:
-            country = None
-    except AttributeError:
-        return (None, None, None, None) # could not decode
-    try:
-        country_abbr = COUNTRY_NAME_TO_ABBR[country]
-    except KeyError:
-        country_abbr = 'none'
-    return (country_abbr, number, base_name, event_name)
+    size = table_sizes.setdefault(table, [0, 0])
+    size[0] += 1
+    size[1] += ROW_OVERHEAD_BYTES + fixed_bytes + sum((2 * len(t) if isinstance(t, str) else len(t)) + 2 for t in texts)
+
+
+def print_size_summary():
+    '''Print rows and estimated data and index size of every table written by this run'''
+    print(f'\n{"Table":<12}{"Rows":>12}{"Data MB":>12}{"Index MB":>12}')
+    # Games rows are counted while parsing when streaming, print in script order regardless
+    for table in sorted(table_sizes, key=list(TABLE_DDL).index):
+        rows, data_bytes = table_sizes[table]
+        index_bytes = sum(rows * (key_bytes + ROW_OVERHEAD_BYTES) for t, _, _, key_bytes in INDEXES if t == table)
+        print(f'{table:<12}{rows:>12,}{data_bytes / 2**20:>12.2f}{index_bytes / 2**20:>12.2f}')
+
+
+def sql_value(value):
+    if isinstance(value, str):
+        return f"'{sql_escape(value)}'"
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    return str(value)
+
+
+def sql_values(values):
+    '''Format a row of values as the (...) of an INSERT statement'''
+    return '(' + ', '.join(sql_value(v) for v in values) + ')'
+
 
+def bulk_values(values):
+    '''
+    Format a row of values as a line of a BULK INSERT data file. Tag values are condensed by spaces()
+    so they never contain the tab or newline terminators. An empty field loads as NULL, so an empty
+    string, or the empty Moves of a game without moves, is written as NUL, the bcp marker for a zero
+    length value.
+    '''
+    return '\t'.join((v or '\0') if isinstance(v, str) else (v.hex() or '\0') if isinstance(v, bytes) else str(v)
+                     for v in values)
+
+
+def json_values(values):
+    '''Format a row of values as a line of JSON, bytes as hex, for the --load spool'''
+    return json.dumps(values, default=bytes.hex)
+
+
+# Row formatter of the chosen output format, sql_values or bulk_values
+format_row = sql_values
+
+
+def game_values(game_id, game, country_id, event_id, black_id, white_id):
+    '''Values of one row of the Games table, from a GameRecord'''
+    count_row('Games', 8 * 4 + 3, game.event, game.round, game.place, game.result, game.moves)
+    return (game_id, country_id, black_id, game.black_rank, white_id, game.white_rank, event_id,
+            game.event, game.round, game.place, game.result, game.who_won, game.get_date(), game.moves)
+
+
+class GameSpool(object):
+    '''
+    Spooled temporary section of Games rows formatted by format_row(), one row per line. Used by --stream so that
+    neither the SGFWrapper objects nor the row strings are held in memory until the end of the run.
+    Rows stay in memory up to max_size bytes, then the spool rolls over to a temporary file on disk.
+    '''
+    def __init__(self, max_size=16 * 1024 * 1024):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+', encoding='utf-8')
+        self.row_count = 0
+
+    def add(self, line):
+        # Tag values are condensed by spaces() so a row never contains a newline
+        self.file.write(line + '\n')
+        self.row_count += 1
 
-def output_lines(statement, lines, max_lines=1000):
+    def lines(self):
+        self.file.seek(0)
+        for line in self.file:
+            yield line.rstrip('\n')
+
+    def close(self):
+        self.file.close()
+
+
+class GameResultSpool(object):
+    '''
+    Spooled temporary file of the results of the games of this run, (game ID, black ID, white ID, who won, date,
+    event ID) packed as GAME_RESULT_DTYPE records, 27 bytes a game instead of a tuple of Python objects.
+    '''
+    RECORD = struct.Struct('<iiib10si')
+
+    def __init__(self, max_size=16 * 1024 * 1024):
+        assert self.RECORD.size == GAME_RESULT_DTYPE.itemsize
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+b')
+        self.count = 0
+
+    def add(self, game_id, black_id, white_id, who_won, date, event_id):
+        self.file.write(self.RECORD.pack(game_id, black_id, white_id, who_won, date.encode('ascii'), event_id))
+        self.count += 1
+
+    def array(self):
+        '''
+        :return: GAME_RESULT_DTYPE array of the results, in game ID order
+        '''
+        self.file.seek(0)
+        return np.frombuffer(self.file.read(), GAME_RESULT_DTYPE)
+
+    def write_to(self, fp):
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, fp)
+
+    def close(self):
+        self.file.close()
+
+
+def output_lines(outp, statement, lines, max_lines=1000):
     '''
     Output max_lines at a time, repeat output statement each in each batch of max_lines
     '''
@@ -155,46 +349,121 @@ def output_lines(statement, lines, max_lines=1000):
             print('   ,' + line, file=outp)
 
 ##############################################################################
-# Initial TGZ Parse
-
-tar_file = tarfile.open('./GoKifu.tgz', 'r:gz')
-processed_files = 0
-last_output = datetime.now()
-
-# Parse TGZ and fill dictionaries with data
-for tarinfo in tar_file:
-    # Load and parse the next SGF file
-    processed_files += 1
-    if processed_files % 1000 == 0:
-        print(f'Processed {processed_files} files - {datetime.now() - last_output}')
-        last_output = datetime.now()
-    # if processed_files == 100:
-    #     break
-    file_name, extension = os.path.splitext(tarinfo.name)
-    if extension.lower() != '.sgf':
-        continue
-    sgf_file_name = tarinfo.name
-    sgf_file_text = tar_file.extractfile(tarinfo).read().decode('utf-8')
+# Initial Game File Parse
+
+def read_sgf_members(source, skip_known=False):
+    '''
+    Stream (file_name, sgf_file_bytes) for every SGF member of the source, in source order.
+    The content hash of every member is recorded in manifest_members.
+    :param source: iterable of (file_name, file_bytes) from game_store.open_game_source()
+    :param skip_known: only yield members that are not in the loaded manifest, by name or by content
+    '''
+    known_hashes = set(manifest_members.values()) if skip_known else set()
+    skipped = 0
+    duplicates = 0
+    for member_name, sgf_file_bytes in report.timed('read', source):
+        file_name, extension = os.path.splitext(member_name)
+        if extension.lower() != '.sgf':
+            report.count('files', 'not sgf')
+            continue
+        # Members already imported are skipped by name, without hashing them again
+        if skip_known and member_name in manifest_members:
+            skipped += 1
+            continue
+        with report.stage('hash'):
+            digest = hashlib.sha1(sgf_file_bytes).hexdigest()
+        if digest in known_hashes:
+            duplicates += 1
+            continue
+        manifest_members[member_name] = digest
+        yield member_name, sgf_file_bytes
+    report.count('files', 'skipped, in manifest', skipped)
+    report.count('files', 'skipped, same content as a file in the manifest', duplicates)
+    if skip_known:
+        print(f'Skipped {skipped} files already in the manifest and {duplicates} new names with the content of one '
+              f'(a full import is needed to pick up edited files)')
+
+
+def reject_reason(error):
+    '''
+    RuntimeError message without the detail of the one record, the reason rejects are counted under
+        'SGFWrapper.parse(): parse error of SGF record [...]' -> 'SGFWrapper.parse(): parse error of SGF record'
+    '''
+    return _REASON_DETAIL.sub('', str(error))
+
+
+def parse_sgf_member(member, validate=False):
+    '''
+    Parse one SGF record and decode its event tag. Runs inside the worker processes when --workers > 1,
+    so it must not touch the players/events/base_events globals.
+    :param member: (file_name, sgf_file_bytes)
+    :param validate: also run SGFWrapper.is_valid_for_database_import() for the report, the game is kept either way
+    :return: (stage_seconds, game, decoded_event, reason). stage_seconds are the seconds of each of PARSE_STAGES.
+        game is a GameRecord, or None if the record could not be parsed or its date or moves could not be decoded,
+        reason is then the reject_reason(). For a game that fails validation reason is its why_invalid, else None.
+    '''
+    file_name, sgf_file_bytes = member
+    # Each record is parsed exactly once, inside SGFWrapper, and only the GameRecord is kept
+    start = time.perf_counter()
     try:
-        game_collection = sgf.parse(sgf_file_text)
-    except (sgf.ParseException, UnboundLocalError):
-        continue
+        sgf_game = SGFWrapper(sgf_file_bytes, file_name)
+    except RuntimeError as e:
+        return (time.perf_counter() - start, 0.0, 0.0, 0.0), None, None, reject_reason(e)
+    scanned = time.perf_counter()
     try:
-        sgf_game = SGFWrapper(sgf_file_text, tarinfo.name)
+        game = GameRecord.from_sgf(sgf_game)
     except RuntimeError as e:
-        continue
+        return (scanned - start, time.perf_counter() - scanned, 0.0, 0.0), None, None, reject_reason(e)
+    recorded = time.perf_counter()
+    why_invalid = None
+    if validate and not sgf_game.is_valid_for_database_import():
+        why_invalid = sgf_game.why_invalid
+    validated = time.perf_counter()
+
+    # Decode the EV Tag, with the country from known identifying strings of the name if the tag has none
+    decoded_event = classify_event(game.event)
+    return ((scanned - start, recorded - scanned, validated - recorded, time.perf_counter() - validated),
+            game, decoded_event, why_invalid)
+
 
-    # Decode the EV Tag
-    country_abbr, number, base_name, event_name = decode_event(sgf_game.tag_dict['EV'])
-    if base_name == None:
-        continue
+def parse_sgf_chunk(chunk, validate=False):
+    '''Worker entry point, parses a list of members so each IPC round trip carries many files'''
+    return [parse_sgf_member(member, validate) for member in chunk]
 
-    # If country not found, try searching names for known identifying strings to set country code
-    if country_abbr == 'none':
-        for k,v in TOURNAMENT_COUNTRY.items():
-            if re.search(k, base_name, re.IGNORECASE):
-                country_abbr = v
-                break
+
+def parse_sgf_members(members, workers=1, chunk_size=64, validate=False):
+    '''
+    Yield parse_sgf_member() results in the same order as members, using a pool of worker processes
+    when workers > 1. At most workers * 2 chunks are in flight so the reader cannot run far ahead of the pool.
+    '''
+    if workers <= 1:
+        for member in members:
+            yield parse_sgf_member(member, validate)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        chunk = []
+        for member in members:
+            chunk.append(member)
+            if len(chunk) < chunk_size:
+                continue
+            pending.append(pool.apply_async(parse_sgf_chunk, (chunk, validate)))
+            chunk = []
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().get()
+        if chunk:
+            pending.append(pool.apply_async(parse_sgf_chunk, (chunk, validate)))
+        while pending:
+            yield from pending.popleft().get()
+
+
+def add_game(game, country_abbr, number, base_name, event_name):
+    '''
+    Merge one parsed GameRecord into the players/events/base_events dictionaries and the game list.
+    IDs are handed out in call order, so calling this in source order gives the same IDs on every run.
+    '''
+    global last_base_event_id, last_event_id, last_game_id
 
     try:
         country_id = country_code_to_id(country_abbr)
@@ -211,159 +480,806 @@ for tarinfo in tar_file:
         last_event_id += 1
         try:
             use_base_event_id = base_events[base_name]['base_event_id']
-            use_base_country = base_events[base_name]['country_id']
         except KeyError:
             raise RuntimeError(f'Could not find [{event_name}] ')
         events[event_name] = dict(event_id=last_event_id, base_event_id=use_base_event_id, number=number)
 
     # Try adding both players, will do nothing if already exists
-    add_player(sgf_game.tag_dict['PB'], sgf_game.tag_dict['BC'])
-    add_player(sgf_game.tag_dict['PW'], sgf_game.tag_dict['WC'])
+    black_id = add_player(game.black_name, game.black_country)
+    white_id = add_player(game.white_name, game.white_country)
+
+    # Add game to list, or format its row straight into the spool when streaming
+    last_game_id += 1
+    event_id = events[event_name]['event_id']
+    game_results.add(last_game_id, black_id, white_id, game.who_won, game.get_date(), event_id)
+    player_stats.add_game(last_game_id, black_id, white_id, game.who_won, game.get_date(), event_id)
+    if position_index is not None or opening_tree is not None:
+        move_pair_list = game.move_pair_list
+        if position_index is not None:
+            position_index.add_game(last_game_id, move_pair_list)
+        if opening_tree is not None:
+            opening_tree.add_game(last_game_id, move_pair_list, black_id, white_id, event_id, game.who_won)
+    if game_spool is not None:
+        game_spool.add(format_row(game_values(last_game_id, game, country_id, event_id, black_id, white_id)))
+    else:
+        game_list.append((game, country_id, event_id, black_id, white_id))
 
-    # Add game to list
-    game_list.append(dict(
-        sgf_game=sgf_game,
-        country_id=country_id,
-        event_id=events[event_name]['event_id']
-    ))
+
+def add_replayed_games(pending, replay_rejects):
+    '''
+    Replay the moves of the pending games together on the board and add the games without an illegal move,
+    in their original order so the IDs do not depend on the batch size
+    :param pending: list of (game, decoded_event)
+    :param replay_rejects: dictionary of error name: count, updated
+    '''
+    with report.stage('replay', len(pending)):
+        batch = replay_games([game.move_pair_list for game, decoded_event in pending])
+    for (game, decoded_event), error in zip(pending, batch.error):
+        if error != LEGAL:
+            replay_rejects[ERROR_NAMES[error]] = replay_rejects.get(ERROR_NAMES[error], 0) + 1
+            continue
+        with report.stage('merge'):
+            add_game(game, *decoded_event)
+    pending.clear()
+
+
+def sample_members(members, sample):
+    '''
+    Pass members through, keeping the bytes of the first PARSE_BASELINE_SAMPLE in sample
+    '''
+    for member in members:
+        if len(sample) < PARSE_BASELINE_SAMPLE:
+            sample.append(member[1])
+        yield member
+
+
+def print_parse_baseline(sample, workers, parse_seconds, total_seconds):
+    '''
+    Time the scanner and the sgf package on the sample, see sgf_parser_check.py, and print the share of the
+    import SGF parsing would take with the package, scaling the scan time of this run by their ratio
+    '''
+    timings = {name: seconds for name, seconds, results in time_parsers(sample)}
+    scanner_ms = 1000 * timings['scanner'] / max(len(sample), 1)
+    package_ms = 1000 * timings['sgf package'] / max(len(sample), 1)
+    scan_seconds = report.seconds('scan')
+    package_scan_seconds = scan_seconds * package_ms / max(scanner_ms, 1e-9)
+    package_total_seconds = total_seconds + (package_scan_seconds - scan_seconds) / max(workers, 1)
+    package_parse_seconds = parse_seconds - scan_seconds + package_scan_seconds
+    package_share = 100 * package_parse_seconds / max(package_total_seconds, 1e-9) / max(workers, 1)
+    report.info['parse_baseline'] = dict(sample_files=len(sample), scanner_ms_per_file=round(scanner_ms, 4),
+                                         sgf_package_ms_per_file=round(package_ms, 4),
+                                         sgf_package_percent_of_import=round(package_share, 1))
+    print(f'   SGF parse with the sgf package: {package_ms:.3f}ms per file against {scanner_ms:.3f}ms for the '
+          f'scanner on {len(sample)} files, about {package_share:.1f}% of import time')
+
+
+def import_games(source_path, workers=1, incremental=False, replay_check=False, validate=False):
+    '''
+    Parse the game files and fill dictionaries with data
+    :param source_path: TGZ, zip, harvester archive directory or plain directory, see game_store.open_game_source()
+    :param incremental: skip the members recorded in the loaded manifest
+    :param replay_check: replay every game on the board and reject games with an illegal move
+    :param validate: count the why_invalid of the games in the report, see parse_sgf_member(), and compare
+        the parse time with the sgf package on a sample of the files, see print_parse_baseline()
+    '''
+    source = open_game_source(source_path)
+    sample = []
+    processed_files = 0
+    rejected_files = 0
+    start_time = datetime.now()
+    last_output = start_time
+    pending = []
+    replay_rejects = report.counters.setdefault('replay_rejects', {})
+
+    members = read_sgf_members(source, incremental)
+    if validate:
+        members = sample_members(members, sample)
+    for stage_seconds, game, decoded_event, reason in parse_sgf_members(members, workers, validate=validate):
+        processed_files += 1
+        for stage, seconds in zip(PARSE_STAGES, stage_seconds):
+            if seconds:
+                report.add(stage, seconds)
+        if processed_files % 1000 == 0:
+            print(f'Processed {processed_files} files - {datetime.now() - last_output}')
+            last_output = datetime.now()
+        if game is None:
+            rejected_files += 1
+            report.count('parse_rejects', reason)
+            continue
+        if reason is not None:
+            report.count('why_invalid', reason)
+        country_abbr, number, base_name, event_name = decoded_event
+        if base_name == None:
+            report.count('undecodable_events', game.event)
+            continue
+        if replay_check:
+            pending.append((game, decoded_event))
+            if len(pending) == DEFAULT_BATCH_SIZE:
+                add_replayed_games(pending, replay_rejects)
+        else:
+            with report.stage('merge'):
+                add_game(game, country_abbr, number, base_name, event_name)
+    if pending:
+        add_replayed_games(pending, replay_rejects)
+
+    total_time = datetime.now() - start_time
+    kept_games = last_game_id - previous_ids['game']
+    parse_seconds = report.seconds('scan') + report.seconds('record')
+    report.info.update(files=processed_files, rejected_files=rejected_files, games=kept_games,
+                       import_seconds=round(total_time.total_seconds(), 3))
+    print(f'Parsed {processed_files} files ({rejected_files} rejected by parser, {kept_games} games kept) '
+          f'in {total_time} using {max(workers, 1)} worker(s)')
+    print(f'   SGF parse: {parse_seconds:.2f}s total, {1000 * parse_seconds / max(processed_files, 1):.3f}ms per file, '
+          f'{100 * parse_seconds / max(total_time.total_seconds(), 1e-9) / max(workers, 1):.1f}% of import time')
+    if sample:
+        print_parse_baseline(sample, workers, parse_seconds, total_time.total_seconds())
+    print(f'   Player names: {len(player_names.resolved)} distinct, {player_names.merged} merged into another spelling')
+    if replay_check:
+        print(f'   Replay check rejected {sum(replay_rejects.values())} games: '
+              + (', '.join(f'{name} {count}' for name, count in sorted(replay_rejects.items())) or 'none'))
+
+##############################################################################
+# Import Manifest
+
+def stats_path(manifest_path):
+    '''Counters of player_stats saved with the manifest, import_manifest.json has import_manifest.stats.npz'''
+    return os.path.splitext(manifest_path)[0] + '.stats.npz'
+
+
+def ratings_path(manifest_path):
+    '''State of rating_engine saved with the manifest, import_manifest.json has import_manifest.ratings.npz'''
+    return os.path.splitext(manifest_path)[0] + '.ratings.npz'
+
+
+def history_path(manifest_path):
+    '''
+    Game history saved with the manifest, import_manifest.json has import_manifest.games.bin: the result of every game
+    imported as GAME_RESULT_DTYPE records in game ID order. Each run appends its games, an incremental import only
+    reads it when a new game is dated on or before the last rated day and the ratings have to be replayed.
+    '''
+    return os.path.splitext(manifest_path)[0] + '.games.bin'
+
+
+def history_count(path, last_game_id):
+    '''Number of records of the game history at path with a game ID up to last_game_id'''
+    if not os.path.exists(path) or os.path.getsize(path) < GAME_RESULT_DTYPE.itemsize:
+        return 0
+    history = np.memmap(path, GAME_RESULT_DTYPE, 'r')
+    return int(np.searchsorted(history['game_id'], last_game_id, side='right'))
+
+
+def read_game_history(path, last_game_id):
+    '''
+    :return: GAME_RESULT_DTYPE array of the games up to last_game_id, records appended by a run whose manifest
+        was never written are left out
+    '''
+    return np.fromfile(path, GAME_RESULT_DTYPE, history_count(path, last_game_id))
+
+
+def save_game_history(path):
+    '''
+    Append the games of this run to the game history, after dropping any records past the games of the manifest
+    loaded, so a full import starts it again
+    '''
+    kept = history_count(path, previous_ids['game'])
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as fp:
+        fp.truncate(kept * GAME_RESULT_DTYPE.itemsize)
+        fp.seek(0, os.SEEK_END)
+        game_results.write_to(fp)
+
+
+def load_manifest(manifest_path):
+    '''
+    Restore the member hashes and player/event/base event ID maps written by save_manifest(),
+    so an incremental import only handles new files and reuses the existing IDs
+    :raises RuntimeError: the player stats counters, rating state or game history are missing or were saved by
+        another run
+    '''
+    global last_player_id, last_base_event_id, last_event_id, last_game_id, player_stats, rating_engine, history_file
+    with open(manifest_path, encoding='utf-8') as fp:
+        manifest = json.load(fp)
+    manifest_members.update(manifest['members'])
+    players.update(manifest['players'])
+    for name in players:
+        player_names.add_known(name)
+    base_events.update(manifest['base_events'])
+    events.update(manifest['events'])
+    last_player_id = manifest['last_player_id']
+    last_base_event_id = manifest['last_base_event_id']
+    last_event_id = manifest['last_event_id']
+    last_game_id = manifest['last_game_id']
+    previous_ids.update(player=last_player_id, base_event=last_base_event_id, event=last_event_id, game=last_game_id)
+    previous_player_countries.update({name: v['country_id'] for name, v in players.items()})
+    history_file = history_path(manifest_path)
+    if history_count(history_file, last_game_id) != last_game_id:
+        raise RuntimeError(f'load_manifest(): {history_path(manifest_path)} does not hold the games of the manifest, '
+                           f'run a full import')
+    if not os.path.exists(stats_path(manifest_path)):
+        raise RuntimeError(f'load_manifest(): {stats_path(manifest_path)} not found, run a full import')
+    player_stats = PlayerStats.load(stats_path(manifest_path))
+    if player_stats.last_game_id != last_game_id:
+        raise RuntimeError(f'load_manifest(): {stats_path(manifest_path)} counts the games up to ID '
+                           f'{player_stats.last_game_id}, the manifest up to {last_game_id}. Run a full import')
+    if not os.path.exists(ratings_path(manifest_path)):
+        raise RuntimeError(f'load_manifest(): {ratings_path(manifest_path)} not found, run a full import')
+    rating_engine = RatingEngine.load_state(ratings_path(manifest_path))
+    if rating_engine.last_game_id != last_game_id:
+        raise RuntimeError(f'load_manifest(): {ratings_path(manifest_path)} rates the games up to ID '
+                           f'{rating_engine.last_game_id}, the manifest up to {last_game_id}. Run a full import')
+
+
+def save_manifest(manifest_path):
+    '''
+    Write the member hashes and ID maps of this run, replacing the previous manifest only once fully written.
+    The player stats counters, rating state and game history are written first, load_manifest() refuses them if
+    the manifest is not written after.
+    '''
+    player_stats.save(stats_path(manifest_path))
+    rating_engine.save_state(ratings_path(manifest_path))
+    save_game_history(history_path(manifest_path))
+    manifest = dict(
+        members=manifest_members,
+        last_player_id=last_player_id,
+        last_base_event_id=last_base_event_id,
+        last_event_id=last_event_id,
+        last_game_id=last_game_id,
+        generation=import_generation,
+        players=players,
+        base_events=base_events,
+        events=events,
+    )
+    with open(manifest_path + '.tmp', mode='w', encoding='utf-8') as fp:
+        json.dump(manifest, fp, ensure_ascii=False)
+    os.replace(manifest_path + '.tmp', manifest_path)
 
 ##############################################################################
 # Produce Output Statements
 
-outp = open('output.sql', mode='w')
-print(f'USE [{DATABASE_NAME}]\n', file=outp)
-
-######################################
-# Countries
-
-lines = []
-print('-- COUNTRIES', file=outp)
-print(f'CREATE TABLE Countries (\n'
-      f'   Id INT PRIMARY KEY IDENTITY,\n'
-      f'   Code NVARCHAR(5),\n'
-      f'   Name NVARCHAR(30)\n'
-      f')\n', file=outp)
-print('SET IDENTITY_INSERT Countries ON', file=outp)
-
-for idx, country in enumerate(COUNTRIES):
-    lines.append(f"({country[0]}, '{country[1]}', '{country[2]}')")
-output_lines(f'INSERT INTO Countries (Id, Code, Name) VALUES ', lines)
-
-print('\nSET IDENTITY_INSERT Countries OFF', file=outp)
-
-######################################
-# Base Events
-
-print('\n\n-- BaseEvents', file=outp)
-print('CREATE TABLE BaseEvents (\n'
-      '   Id INT PRIMARY KEY IDENTITY,\n'
-      '   Name NVARCHAR(100) NOT NULL,\n'
-      '   CountryId INT FOREIGN KEY REFERENCES Countries(Id)\n'
-      ')', file=outp)
-lines = ["(0, 'none', 0)"]
-for base_event_name, v in sorted(base_events.items(), key=lambda x: x[1]['country_id']):
-    base_event_id = v['base_event_id']
-    country_id = v['country_id']
-    lines.append(f"({base_event_id}, '{sql_escape(base_event_name)}', {country_id})")
-
-print('\nSET IDENTITY_INSERT BaseEvents ON', file=outp)
-output_lines('INSERT INTO BaseEvents (Id, Name, CountryId) VALUES ', lines)
-print('\nSET IDENTITY_INSERT BaseEvents OFF', file=outp)
-
-
-######################################
-# Events
-
-print('\n\n-- Events', file=outp)
-print('CREATE TABLE Events (\n'
-      '   Id INT PRIMARY KEY IDENTITY,\n'
-      '   Name NVARCHAR(100) NOT NULL,\n'
-      '   Number INT NOT NULL,\n'
-      '   BaseEventId INT FOREIGN KEY REFERENCES BaseEvents(Id)\n'
-      ')', file=outp)
-print('\nSET IDENTITY_INSERT Events ON', file=outp)
-
-lines = ["(0, 'none', 0, 0)"]
-for event_name, v in sorted(events.items(), key=lambda x: x[1]['event_id']):
-    event_id = v['event_id']
-    base_event_id = v['base_event_id']
-    number = v['number']
-    lines.append(f"({event_id}, '{sql_escape(event_name)}', {number}, {base_event_id})")
-
-output_lines('INSERT INTO Events (Id, Name, Number, BaseEventId) VALUES ', lines)
-print('\nSET IDENTITY_INSERT Events OFF', file=outp)
-
-
-######################################
-# Players
-
-print('\n\n-- Players', file=outp)
-print('CREATE TABLE Players (\n'
-      '   Id INT PRIMARY KEY IDENTITY,\n'
-      '   Name NVARCHAR(100) NOT NULL,\n'
-      '   CountryId INT FOREIGN KEY REFERENCES Countries(Id)'
-      ')', file=outp)
-
-lines = []
-print('\nSET IDENTITY_INSERT Players ON', file=outp)
-for player, v in players.items():
-    player_id = v['player_id']
-    country_id = v['country_id']
-    lines.append(f"({player_id}, '{sql_escape(player)}', {country_id})")
-output_lines('INSERT INTO Players (Id, Name, CountryId) VALUES', lines)
-
-
-print('\nSET IDENTITY_INSERT Players OFF', file=outp)
-
-
-######################################
-# Games
-print('\n\n-- Games', file=outp)
-print('CREATE TABLE Games (\n'
-      '   Id INT PRIMARY KEY IDENTITY,\n'
-      '   CountryId INT FOREIGN KEY REFERENCES Countries(Id),\n'
-      '   BlackId INT FOREIGN KEY REFERENCES Players(Id),\n'
-      '   BlackRank INT NOT NULL,\n'
-      '   WhiteId INT FOREIGN KEY REFERENCES Players(Id),\n'
-      '   WhiteRank INT NOT NULL,\n'
-      '   EventsID INT FOREIGN KEY REFERENCES Events(Id),\n'
-      '   Event NVARCHAR(100),\n'
-      '   Round NVARCHAR(100),\n'
-      '   Place NVARCHAR(100),\n'
-      '   Result NVARCHAR(25) NOT NULL,\n'
-      '   WhoWonInt INT NOT NULL,\n'
-      '   Date DATE NOT NULL,\n'
-      '   Moves NVARCHAR(1000) NOT NULL\n'
-      ')', file=outp)
-
-lines = []
-game_id = 0
-print('\nSET IDENTITY_INSERT Games ON', file=outp)
-for game in game_list:
-    sgf_game = game['sgf_game']
-    event_id = game['event_id']
-    country_id = game['country_id']
-    game_id += 1
-    td = sgf_game.tag_dict
-    black_id = players[td['PB']]['player_id']
-    white_id = players[td['PW']]['player_id']
-    black_rank = sgf_game.get_player_rank(1)
-    white_rank = sgf_game.get_player_rank(-1)
-    whowon = sgf_game.get_who_won()
-    date = sgf_game.get_date()
-    moves = ''.join(sgf_game.move_pair_list)
-    lines.append(f"({game_id}, {country_id}, {black_id}, {black_rank}, {white_id}, "
-                 f"{white_rank}, {event_id}, '{sql_escape(td['EV'])}', '{sql_escape(td['RO'])}', '{sql_escape(td['PC'])}', "
-                 f"'{sql_escape(td['RE'])}', {whowon}, '{sql_escape(date)}', '{sql_escape(moves)}')")
-
-output_lines('INSERT INTO Games (Id, CountryId, BlackId, BlackRank, WhiteId, WhiteRank, EventsID, '
-             'Event, Round, Place, Result, WhoWonInt, Date, Moves) VALUES', lines)
-print('\nSET IDENTITY_INSERT Games OFF', file=outp)
+def country_rows(incremental):
+    if incremental:
+        return
+    for country in COUNTRIES:
+        count_row('Countries', 4, country[1], country[2])
+        yield country
+
+
+def base_event_rows(incremental):
+    if not incremental:
+        yield (0, 'none', 0)
+    for base_event_name, v in sorted(base_events.items(), key=lambda x: x[1]['country_id']):
+        base_event_id = v['base_event_id']
+        if base_event_id <= previous_ids['base_event']:
+            continue
+        count_row('BaseEvents', 2 * 4, base_event_name)
+        yield (base_event_id, base_event_name, v['country_id'])
+
+
+def event_rows(incremental):
+    if not incremental:
+        yield (0, 'none', 0, 0)
+    for event_name, v in sorted(events.items(), key=lambda x: x[1]['event_id']):
+        event_id = v['event_id']
+        if event_id <= previous_ids['event']:
+            continue
+        count_row('Events', 3 * 4, event_name)
+        yield (event_id, event_name, v['number'], v['base_event_id'])
+
+
+def player_rows():
+    for player, v in players.items():
+        player_id = v['player_id']
+        if player_id <= previous_ids['player']:
+            continue
+        count_row('Players', 2 * 4, player)
+        yield (player_id, player, v['country_id'])
+
+
+def player_country_changes():
+    '''
+    (country_id, player_id) of existing players, a new game may have supplied the country that was missing before
+    '''
+    for player, v in players.items():
+        if v['player_id'] <= previous_ids['player'] and v['country_id'] != previous_player_countries[player]:
+            yield (v['country_id'], v['player_id'])
+
+
+def player_country_updates():
+    for country_id, player_id in player_country_changes():
+        yield f'UPDATE Players SET CountryId = {country_id} WHERE Id = {player_id}'
+
+
+def game_rows():
+    '''Values of the Games rows kept in game_list'''
+    return (game_values(game_id, game, country_id, event_id, black_id, white_id)
+            for game_id, (game, country_id, event_id, black_id, white_id)
+            in enumerate(game_list, start=previous_ids['game'] + 1))
+
+
+def game_lines():
+    '''Games rows formatted by format_row()'''
+    if game_spool is not None:
+        # Streaming, the rows were formatted during the parse
+        return game_spool.lines()
+    return (format_row(row) for row in game_rows())
+
+
+def id_lists(ids, max_ids=1000):
+    '''Sorted ids as comma separated lists of at most max_ids, to keep the IN lists of DELETE statements short'''
+    ids = sorted(ids)
+    for first in range(0, len(ids), max_ids):
+        yield ', '.join(str(i) for i in ids[first:first + max_ids])
+
+
+def player_stats_tables(incremental):
+    '''
+    PlayerStats and HeadToHead rows, see player_stats.PlayerStats. A full import writes the rows of every player.
+    An incremental import rewrites the rows of the players in the new games and of the opponents of players
+    whose country changed, the old rows of those players are deleted first.
+    :return: (DELETE statements, PlayerStats rows, HeadToHead rows)
+    '''
+    player_countries = {v['player_id']: v['country_id'] for v in players.values()}
+    player_ids = None
+    deletes = []
+    if incremental:
+        player_ids = player_stats.affected_players(player_id for country_id, player_id in player_country_changes())
+        for id_list in id_lists(player_ids):
+            deletes.append(f'DELETE FROM PlayerStats WHERE PlayerId IN ({id_list})')
+            deletes.append(f'DELETE FROM HeadToHead WHERE PlayerId IN ({id_list}) OR OpponentId IN ({id_list})')
+
+    def stats_rows():
+        for row in player_stats.player_rows(player_countries, player_ids):
+            count_row('PlayerStats', 5 * 4, row[1])
+            yield row
+
+    def head_to_head_rows():
+        for row in player_stats.head_to_head_rows(min_head_to_head_games, player_ids):
+            count_row('HeadToHead', 5 * 4 + 2 * 3)
+            yield row
+
+    return deletes, stats_rows(), head_to_head_rows()
+
+
+def rating_tables(incremental):
+    '''
+    Ratings and RatingHistory rows, see ratings.RatingEngine. An incremental import continues from the rating
+    state of the last run and rates the new games on from it. A new game dated on or before the last rated day
+    makes the engine replay the game history of earlier runs with the new games, the timeline then changes from
+    the date of the oldest new game. The history from that date on and the ratings of the players it touched
+    are deleted and written again.
+    :return: (DELETE statements, Ratings rows, RatingHistory rows)
+    '''
+    global rating_engine
+    deletes = []
+    new_results = game_results.array()
+    if incremental:
+        engine = rating_engine
+        resumed_from = engine.resumed_from
+        with report.stage('ratings', len(new_results)):
+            since = engine.add_games(new_results,
+                                     history=lambda: read_game_history(history_file, previous_ids['game']))
+        if resumed_from is not None and engine.resumed_from is None:
+            print(f'   Ratings replayed from the game history, new games dated on or before {resumed_from}')
+        if since is None:
+            return deletes, iter(()), iter(())
+        player_ids = engine.players_since(since)
+        for id_list in id_lists(player_ids):
+            deletes.append(f'DELETE FROM Ratings WHERE PlayerId IN ({id_list})')
+        deletes.append(f"DELETE FROM RatingHistory WHERE Date >= '{since}'")
+    else:
+        engine = rating_engine = RatingEngine()
+        with report.stage('ratings', len(new_results)):
+            engine.add_games(new_results)
+        player_ids = None
+        since = None
+
+    def rating_rows():
+        for row in engine.rating_rows(player_ids):
+            count_row('Ratings', 3 * 4 + 3)
+            yield row
+
+    def history_rows():
+        for row in engine.history_rows(since):
+            count_row('RatingHistory', 3 * 4 + 3)
+            yield row
+
+    return deletes, rating_rows(), history_rows()
+
 
+def import_info_values(incremental):
+    return (import_generation, f'{datetime.now():%Y-%m-%d %H:%M:%S}', int(incremental))
+
+
+def import_info_insert(incremental):
+    return f'INSERT INTO ImportInfo (Generation, ImportedAt, Incremental) VALUES {sql_values(import_info_values(incremental))}'
+
+
+def write_sql_script(output_path, incremental=False):
+    '''
+    Write the SQL script. A full script creates the tables and inserts every row, an incremental
+    script only inserts the rows with IDs handed out after the manifest was loaded.
+    '''
+    outp = open(output_path, mode='w')
+    print(f'USE [{DATABASE_NAME}]\n', file=outp)
+
+    ######################################
+    # Countries
+
+    if not incremental:
+        print('-- COUNTRIES', file=outp)
+        print(TABLE_DDL['Countries'], file=outp)
+        print('SET IDENTITY_INSERT Countries ON', file=outp)
+        lines = [sql_values(row) for row in report.timed('output.Countries', country_rows(incremental))]
+        output_lines(outp, f'INSERT INTO Countries (Id, Code, Name) VALUES ', lines)
+        print('\nSET IDENTITY_INSERT Countries OFF', file=outp)
+
+    ######################################
+    # Base Events
+
+    print('\n\n-- BaseEvents', file=outp)
+    if not incremental:
+        print(TABLE_DDL['BaseEvents'], file=outp)
+    lines = [sql_values(row) for row in report.timed('output.BaseEvents', base_event_rows(incremental))]
+    print('\nSET IDENTITY_INSERT BaseEvents ON', file=outp)
+    output_lines(outp, 'INSERT INTO BaseEvents (Id, Name, CountryId) VALUES ', lines)
+    print('\nSET IDENTITY_INSERT BaseEvents OFF', file=outp)
+
+
+    ######################################
+    # Events
+
+    print('\n\n-- Events', file=outp)
+    if not incremental:
+        print(TABLE_DDL['Events'], file=outp)
+    print('\nSET IDENTITY_INSERT Events ON', file=outp)
+    lines = [sql_values(row) for row in report.timed('output.Events', event_rows(incremental))]
+    output_lines(outp, 'INSERT INTO Events (Id, Name, Number, BaseEventId) VALUES ', lines)
+    print('\nSET IDENTITY_INSERT Events OFF', file=outp)
+
+
+    ######################################
+    # Players
+
+    print('\n\n-- Players', file=outp)
+    if not incremental:
+        print(TABLE_DDL['Players'], file=outp)
+    print('\nSET IDENTITY_INSERT Players ON', file=outp)
+    for update in player_country_updates():
+        print(update, file=outp)
+    lines = [sql_values(row) for row in report.timed('output.Players', player_rows())]
+    output_lines(outp, 'INSERT INTO Players (Id, Name, CountryId) VALUES', lines)
+
+
+    print('\nSET IDENTITY_INSERT Players OFF', file=outp)
+
+
+    ######################################
+    # Games
+    print('\n\n-- Games', file=outp)
+    if not incremental:
+        print(TABLE_DDL['Games'], file=outp)
+
+    print('\nSET IDENTITY_INSERT Games ON', file=outp)
+    output_lines(outp, 'INSERT INTO Games (Id, CountryId, BlackId, BlackRank, WhiteId, WhiteRank, EventsID, '
+                 'Event, Round, Place, Result, WhoWonInt, Date, Moves) VALUES', report.timed('output.Games', game_lines()))
+    print('\nSET IDENTITY_INSERT Games OFF', file=outp)
+
+
+    ######################################
+    # Player Stats and Head To Head
+
+    deletes, stats_rows, head_to_head_rows = player_stats_tables(incremental)
+    print('\n\n-- PlayerStats', file=outp)
+    if not incremental:
+        print(TABLE_DDL['PlayerStats'], file=outp)
+    for delete in deletes:
+        print(delete, file=outp)
+    output_lines(outp, 'INSERT INTO PlayerStats (PlayerId, Category, Value, Games, Wins, Losses) VALUES',
+                 (sql_values(row) for row in report.timed('output.PlayerStats', stats_rows)))
+
+    print('\n\n-- HeadToHead', file=outp)
+    if not incremental:
+        print(TABLE_DDL['HeadToHead'], file=outp)
+    output_lines(outp, 'INSERT INTO HeadToHead (PlayerId, OpponentId, Games, Wins, Losses, FirstDate, LastDate) VALUES',
+                 (sql_values(row) for row in report.timed('output.HeadToHead', head_to_head_rows)))
+
+
+    ######################################
+    # Ratings and Rating History
+
+    deletes, rating_rows, history_rows = rating_tables(incremental)
+    print('\n\n-- Ratings', file=outp)
+    if not incremental:
+        print(TABLE_DDL['Ratings'], file=outp)
+        print(TABLE_DDL['RatingHistory'], file=outp)
+    for delete in deletes:
+        print(delete, file=outp)
+    output_lines(outp, 'INSERT INTO Ratings (PlayerId, Rating, Games, LastDate) VALUES',
+                 (sql_values(row) for row in report.timed('output.Ratings', rating_rows)))
+    output_lines(outp, 'INSERT INTO RatingHistory (PlayerId, Date, Rating, Games) VALUES',
+                 (sql_values(row) for row in report.timed('output.RatingHistory', history_rows)))
+
+
+    ######################################
+    # Indexes, an incremental script adds to tables that already have them
+
+    if not incremental:
+        print('\n\n-- Indexes', file=outp)
+        for table, index_name, key_columns, key_bytes in INDEXES:
+            print(f'CREATE INDEX {index_name} ON {table} ({key_columns})', file=outp)
+
+
+    ######################################
+    # Import Info, written last so the generation only changes once the rows above are in
+
+    print('\n\n-- ImportInfo', file=outp)
+    if not incremental:
+        print(TABLE_DDL['ImportInfo'], file=outp)
+    print('\n' + import_info_insert(incremental), file=outp)
+
+    outp.close()
+
+
+def write_bulk_files(output_dir, incremental=False):
+    '''
+    Write the bulk load format into output_dir:
+        schema.sql      CREATE TABLE statements, full imports only
+        <Table>.dat     rows of each table, UTF-16 tab delimited as written by bcp -w
+        load.sql        BULK INSERT of every .dat file, then the indexes and the ImportInfo row
+    The server then reads the rows straight from the files instead of parsing them out of INSERT statements.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    if not incremental:
+        with open(os.path.join(output_dir, 'schema.sql'), mode='w') as outp:
+            print(f'USE [{DATABASE_NAME}]\n', file=outp)
+            for table, ddl in TABLE_DDL.items():
+                print(f'\n-- {table}\n{ddl}', file=outp)
+
+    deletes, stats_rows, head_to_head_rows = player_stats_tables(incremental)
+    rating_deletes, rating_rows, history_rows = rating_tables(incremental)
+    deletes += rating_deletes
+    tables = [
+        ('Countries', (bulk_values(row) for row in country_rows(incremental))),
+        ('BaseEvents', (bulk_values(row) for row in base_event_rows(incremental))),
+        ('Events', (bulk_values(row) for row in event_rows(incremental))),
+        ('Players', (bulk_values(row) for row in player_rows())),
+        ('Games', game_lines()),
+        ('PlayerStats', (bulk_values(row) for row in stats_rows)),
+        ('HeadToHead', (bulk_values(row) for row in head_to_head_rows)),
+        ('Ratings', (bulk_values(row) for row in rating_rows)),
+        ('RatingHistory', (bulk_values(row) for row in history_rows)),
+    ]
+    with open(os.path.join(output_dir, 'load.sql'), mode='w') as outp:
+        print(f'USE [{DATABASE_NAME}]\n', file=outp)
+        print('-- Bulk load written by 02_generate_sql_script_from_tgz.py --format bulk', file=outp)
+        print('-- Run schema.sql first for a full import, then with DataDir the directory of the .dat files '
+              'as seen by the SQL Server machine:', file=outp)
+        print('--     sqlcmd -S <server> -i load.sql -v DataDir="<directory>"\n', file=outp)
+        for delete in deletes:
+            print(delete, file=outp)
+        for table, lines in tables:
+            # bcp -w files end rows with \r\n, which is what ROWTERMINATOR '\n' means to BULK INSERT
+            with open(os.path.join(output_dir, f'{table}.dat'), mode='w', encoding='utf-16-le', newline='\r\n') as fp:
+                for line in report.timed(f'output.{table}', lines):
+                    fp.write(line + '\n')
+            # Games rows are written in Id order, the hint spares the server a sort into the clustered index
+            order = ', ORDER (Id ASC)' if table == 'Games' else ''
+            print(f"BULK INSERT {table} FROM '$(DataDir)\\{table}.dat' WITH (DATAFILETYPE = 'widechar', "
+                  f"FIELDTERMINATOR = '\\t', ROWTERMINATOR = '\\n', KEEPIDENTITY, TABLOCK{order})", file=outp)
+        for update in player_country_updates():
+            print(update, file=outp)
+        # BULK INSERT skips the foreign key checks, check them once over the whole table instead
+        print('', file=outp)
+        for table in ('BaseEvents', 'Events', 'Players', 'Games', 'PlayerStats', 'HeadToHead', 'Ratings',
+                      'RatingHistory'):
+            print(f'ALTER TABLE {table} WITH CHECK CHECK CONSTRAINT ALL', file=outp)
+        if not incremental:
+            print('', file=outp)
+            for table, index_name, key_columns, key_bytes in INDEXES:
+                print(f'CREATE INDEX {index_name} ON {table} ({key_columns})', file=outp)
+        print('\n' + import_info_insert(incremental), file=outp)
+
+
+def load_database(loader, incremental=False):
+    '''
+    Insert the rows straight into the database through a DatabaseLoader from sql_loader, in the same
+    order as write_sql_script(): tables, rows, then indexes and the ImportInfo row
+    '''
+    tables = [
+        ('Countries', ['Id', 'Code', 'Name'], country_rows(incremental)),
+        ('BaseEvents', ['Id', 'Name', 'CountryId'], base_event_rows(incremental)),
+        ('Events', ['Id', 'Name', 'Number', 'BaseEventId'], event_rows(incremental)),
+        ('Players', ['Id', 'Name', 'CountryId'], player_rows()),
+    ]
+    if game_spool is not None:
+        # Streaming, the rows were spooled as JSON during the parse, Moves is the last value
+        games = (row[:-1] + [bytes.fromhex(row[-1])] for row in map(json.loads, game_spool.lines()))
+    else:
+        games = game_rows()
+    tables.append(('Games', ['Id', 'CountryId', 'BlackId', 'BlackRank', 'WhiteId', 'WhiteRank', 'EventsID',
+                             'Event', 'Round', 'Place', 'Result', 'WhoWonInt', 'Date', 'Moves'], games))
+    deletes, stats_rows, head_to_head_rows = player_stats_tables(incremental)
+    tables.append(('PlayerStats', ['PlayerId', 'Category', 'Value', 'Games', 'Wins', 'Losses'], stats_rows))
+    tables.append(('HeadToHead', ['PlayerId', 'OpponentId', 'Games', 'Wins', 'Losses', 'FirstDate', 'LastDate'],
+                   head_to_head_rows))
+    rating_deletes, rating_rows, history_rows = rating_tables(incremental)
+    deletes += rating_deletes
+    tables.append(('Ratings', ['PlayerId', 'Rating', 'Games', 'LastDate'], rating_rows))
+    tables.append(('RatingHistory', ['PlayerId', 'Date', 'Rating', 'Games'], history_rows))
+
+    if not incremental:
+        for table in TABLE_DDL:
+            loader.create_table(TABLE_DDL[table])
+    for table, columns, rows in tables:
+        print(f'Loading {table}...')
+        if table == 'PlayerStats':
+            for delete in deletes:
+                loader.execute(delete)
+        # The stats tables are keyed by player, they have no IDENTITY column
+        loader.insert(table, columns, report.timed(f'output.{table}', rows), identity=columns[0] == 'Id')
+        if table == 'Players':
+            loader.update(f'UPDATE Players SET CountryId = {loader.placeholder} WHERE Id = {loader.placeholder}',
+                          player_country_changes())
+            loader.commit()
+    if not incremental:
+        print('Creating indexes...')
+        for table, index_name, key_columns, key_bytes in INDEXES:
+            loader.execute(f'CREATE INDEX {index_name} ON {table} ({key_columns})')
+        loader.commit()
+    loader.execute(f'INSERT INTO ImportInfo (Generation, ImportedAt, Incremental) VALUES '
+                   f'({", ".join([loader.placeholder] * 3)})', import_info_values(incremental))
+    loader.commit()
+    loader.print_summary()
 
 ##############################################################################
-# Finished, cleanup
-outp.close()
-print('\n-----------\nDone.')
+# Entry Point
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the BGO SQL script from a TGZ or archive of SGF game records')
+    parser.add_argument('--input', default='./GoKifu.tgz',
+                        help='SGF files to import: TGZ, zip, harvester --archive directory or plain directory')
+    parser.add_argument('--output', default='output.sql',
+                        help='SQL script to write, or the directory to write to with --format bulk')
+    parser.add_argument('--format', choices=['sql', 'bulk'], default='sql',
+                        help='sql: one script of INSERT statements, bulk: schema, BULK INSERT data files and loader')
+    parser.add_argument('--load', action='store_true',
+                        help='insert the rows straight into the SQL Server database in .env instead of writing --output')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='with --load, load into this SQLite file instead, a local stand-in for testing')
+    parser.add_argument('--commit-rows', type=int, default=50000, help='with --load, rows per transaction')
+    parser.add_argument('--position-index', metavar='PATH',
+                        help='also write the position search index served by /Search/Position to PATH, '
+                             'with --incremental the new games are added to the existing index')
+    parser.add_argument('--position-moves', type=int,
+                        help=f'index the positions after each of the first N moves of a game, default {DEFAULT_MOVES}. '
+                             f'With --incremental it must match the existing index')
+    parser.add_argument('--opening-tree', metavar='PATH',
+                        help='also write the opening tree served by /Openings to PATH, '
+                             'with --incremental the new games are added to the existing tree')
+    parser.add_argument('--opening-moves', type=int,
+                        help=f'depth of the opening tree in moves, at most 255, default {DEFAULT_OPENING_MOVES}. '
+                             f'With --incremental it must match the existing tree')
+    parser.add_argument('--opening-min-games', type=int,
+                        help=f'leave sequences played in fewer games out of the opening tree, default {DEFAULT_MIN_GAMES}. '
+                             f'With --incremental the setting of the existing tree')
+    parser.add_argument('--min-head-to-head-games', type=int, default=DEFAULT_MIN_HEAD_TO_HEAD_GAMES,
+                        help='write HeadToHead rows for pairs of players with at least N games together, '
+                             'an incremental import only applies it to the players it touches')
+    parser.add_argument('--player-aliases', metavar='PATH',
+                        help='alias table of canonical player name: list of other spellings, see player_names.py. '
+                             'Changes that merge players already imported need a full import')
+    parser.add_argument('--replay-check', action='store_true',
+                        help='replay every game on the board and reject games with an illegal move')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of parse worker processes, IDs and output are identical to a serial run')
+    parser.add_argument('--stream', action='store_true',
+                        help='spool Games rows to a temporary file while parsing instead of keeping every game '
+                             'in memory, the results for the ratings are spooled too, 27 bytes a game')
+    parser.add_argument('--manifest', default='import_manifest.json',
+                        help='import manifest of member hashes and ID maps, written at the end of every run')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only import files not in the manifest and only emit INSERTs for the new rows')
+    parser.add_argument('--report', metavar='PATH',
+                        help='write a JSON report of the time spent in each stage and the rejects by reason to PATH, '
+                             'also counts the why_invalid reasons of the kept games')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='run the import under cProfile and dump the stats to PATH, for python -m pstats. '
+                             'With --workers the parsing in the worker processes is not profiled')
+    args = parser.parse_args()
 
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
 
+    if args.player_aliases:
+        try:
+            player_names = PlayerNames(load_aliases(args.player_aliases))
+        except (OSError, ValueError, RuntimeError) as e:
+            parser.error(f'--player-aliases: {e}')
+    if args.incremental:
+        if not os.path.exists(args.manifest):
+            parser.error(f'--incremental needs the manifest of a previous run, {args.manifest} not found')
+        with report.stage('manifest load'):
+            try:
+                load_manifest(args.manifest)
+            except (OSError, ValueError, RuntimeError) as e:
+                parser.error(f'--incremental: {e}')
+    if args.sqlite and not args.load:
+        parser.error('--sqlite needs --load')
+    if args.load:
+        loader = SQLiteLoader(args.sqlite, args.commit_rows) if args.sqlite else \
+            DatabaseLoader(connect_from_env(), args.commit_rows)
+        format_row = json_values
+    elif args.format == 'bulk':
+        format_row = bulk_values
+    min_head_to_head_games = args.min_head_to_head_games
+    game_results = GameResultSpool()
+    if args.stream:
+        game_spool = GameSpool()
+    # An incremental import adds to the tree and index of the earlier imports, which hold every game imported so far
+    # to the depth they were built with. Without them the new files would only cover the new games.
+    if args.opening_tree:
+        if args.incremental:
+            if not os.path.exists(args.opening_tree):
+                parser.error(f'--opening-tree: {args.opening_tree} not found, --incremental adds to the tree of a '
+                             f'previous run. Build it with a full import')
+            try:
+                opening_tree = OpeningTree.load(args.opening_tree)
+            except (OSError, ValueError, RuntimeError) as e:
+                parser.error(f'--opening-tree: {e}')
+            if args.opening_moves not in (None, opening_tree.max_moves):
+                parser.error(f'--opening-moves {args.opening_moves} differs from the {opening_tree.max_moves} moves of '
+                             f'{args.opening_tree}, changing the depth needs a full import')
+            if args.opening_min_games is not None:
+                # Every game is kept in the file, min_games only applies when the nodes are written
+                opening_tree.min_games = args.opening_min_games
+        else:
+            opening_tree = OpeningTree(DEFAULT_OPENING_MOVES if args.opening_moves is None else args.opening_moves,
+                                       DEFAULT_MIN_GAMES if args.opening_min_games is None else args.opening_min_games)
+    if args.position_index:
+        if args.incremental:
+            if not os.path.exists(args.position_index):
+                parser.error(f'--position-index: {args.position_index} not found, --incremental adds to the index of '
+                             f'a previous run. Build it with a full import')
+            try:
+                position_index = PositionIndex.load(args.position_index)
+            except (OSError, ValueError, RuntimeError) as e:
+                parser.error(f'--position-index: {e}')
+            if args.position_moves not in (None, position_index.max_moves):
+                parser.error(f'--position-moves {args.position_moves} differs from the {position_index.max_moves} '
+                             f'moves of {args.position_index}, changing the depth needs a full import')
+        else:
+            position_index = PositionIndex(DEFAULT_MOVES if args.position_moves is None else args.position_moves)
+    import_games(args.input, args.workers, args.incremental, args.replay_check, validate=args.report is not None)
+    with report.stage('output'):
+        if args.load:
+            load_database(loader, args.incremental)
+            loader.close()
+        elif args.format == 'bulk':
+            write_bulk_files(args.output, args.incremental)
+        else:
+            write_sql_script(args.output, args.incremental)
+    if game_spool is not None:
+        game_spool.close()
+    if position_index is not None:
+        with report.stage('position index save'):
+            position_index.save(args.position_index)
+        print(f'Position index: {len(position_index.keys)} positions written to {args.position_index}')
+    if opening_tree is not None:
+        with report.stage('opening tree save'):
+            node_count = opening_tree.save(args.opening_tree)
+        print(f'Opening tree: {node_count} nodes written to {args.opening_tree}')
+    with report.stage('manifest save'):
+        save_manifest(args.manifest)
+    game_results.close()
+    print_size_summary()
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f'Profile written to {args.profile}')
+    if args.report:
+        report.info.update(generation=import_generation, arguments=vars(args),
+                           tables={table: dict(rows=rows, data_bytes=data_bytes)
+                                   for table, (rows, data_bytes) in table_sizes.items()})
+        report.save(args.report)
+        print(f'Report written to {args.report}')
+    print('\n-----------\nDone.')
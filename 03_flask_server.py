@@ -1,9 +1,18 @@
-from flask import Flask
-from flask_restful import Resource, Api
+from flask import Flask, g, request, make_response
+from flask_restful import Resource, Api, abort
 import pymssql
+import base64
 from dotenv import load_dotenv
 import os
 import datetime
+import functools
+import threading
+import time
+from sql_pool import ConnectionPool, PoolTimeout
+from response_cache import LRUCache
+from sgf_wrapper import SGFWrapper
+from position_index import PositionIndex, position_key
+from opening_tree import OpeningTreeFile
 
 load_dotenv()
 
@@ -12,6 +21,34 @@ SQL_USER = os.environ['user']
 SQL_PASSWORD = os.environ['password']
 SQL_DATABASE = os.environ['database']
 
+# Connection pool settings, optional in .env
+SQL_POOL_SIZE = int(os.environ.get('pool_size', 10))
+SQL_POOL_TIMEOUT = float(os.environ.get('pool_timeout', 30))
+SQL_POOL_HEALTH_CHECK = float(os.environ.get('pool_health_check', 60))
+
+# Response cache settings, optional in .env
+CACHE_SIZE = int(os.environ.get('cache_size', 10000))
+CACHE_TTL = float(os.environ.get('cache_ttl', 3600))
+CACHE_GENERATION_CHECK = float(os.environ.get('cache_generation_check', 10))
+
+# Most IDs accepted by one batch request, SQL Server allows about 2100 parameters per statement
+MAX_BATCH_IDS = 1000
+
+# Game listings, newest first, paged on (Date, Id). The Moves column is left out, fetch /Games/<id> for it.
+GAME_LIST_COLUMNS = 'Id, Date, EventsID, CountryId, BlackId, BlackRank, WhiteId, WhiteRank, Result, WhoWonInt, Round'
+GAME_LIST_ORDER = 'ORDER BY Date DESC, Id DESC'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+RESULT_TO_WHOWON = {'black': 1, 'white': -1, 'unknown': 0}
+
+# Position search index written by 02_generate_sql_script_from_tgz.py --position-index, optional in .env
+POSITION_INDEX = os.environ.get('position_index', 'position_index.bin')
+DEFAULT_POSITION_GAMES = 100
+MAX_POSITION_GAMES = 10000
+
+# Opening tree written by 02_generate_sql_script_from_tgz.py --opening-tree, optional in .env
+OPENING_TREE = os.environ.get('opening_tree', 'opening_tree.bin')
+
 print(SQL_SERVER)
 
 
@@ -22,30 +59,366 @@ print(SQL_SERVER)
 app = Flask(__name__)
 api = Api(app)
 
+# Read only queries, autocommit so a pooled connection never holds a transaction open between requests
+sql_pool = ConnectionPool(lambda: pymssql.connect(SQL_SERVER, SQL_USER, SQL_PASSWORD, SQL_DATABASE, autocommit=True),
+                          max_size=SQL_POOL_SIZE, timeout=SQL_POOL_TIMEOUT, health_check=SQL_POOL_HEALTH_CHECK)
+
 
 def connect_sql():
-    conn = pymssql.connect(SQL_SERVER, SQL_USER, SQL_PASSWORD, SQL_DATABASE)
+    '''
+    Borrow a pooled connection for the rest of the request, it is handed back in return_sql()
+    '''
+    if 'sql_conn' not in g:
+        try:
+            g.sql_conn = sql_pool.acquire()
+        except PoolTimeout as e:
+            abort(503, message=str(e))
+    conn = g.sql_conn
     cursor = conn.cursor(as_dict=False)
     return conn, cursor
 
+
+@app.after_request
+def mark_sql_broken(response):
+    '''
+    Flask-RESTful turns an exception of a handler into a 500 response, so return_sql() never sees it
+    '''
+    if response.status_code >= 500:
+        g.sql_broken = True
+    return response
+
+
+@app.teardown_appcontext
+def return_sql(exc):
+    conn = g.pop('sql_conn', None)
+    broken = g.pop('sql_broken', False)
+    if conn is not None:
+        # A request that failed may have failed because of its connection, do not give that to the next request
+        sql_pool.release(conn, broken=broken or exc is not None)
+
+######################################
+# Response Cache
+
+response_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+generation_lock = threading.Lock()
+generation_state = dict(generation=None, checked=0.0, refreshing=False)
+
+
+def import_generation():
+    '''
+    Import generation written to the ImportInfo table by the SQL generator. Read from the database
+    at most every CACHE_GENERATION_CHECK seconds, the response cache is cleared when it changes.
+    The database is queried outside generation_lock, so a slow pool only delays the request that refreshes,
+    the others keep the known generation meanwhile.
+    :return: int generation, 0 for a database created before ImportInfo existed
+    '''
+    with generation_lock:
+        known = generation_state['generation']
+        if time.monotonic() - generation_state['checked'] < CACHE_GENERATION_CHECK or \
+                (generation_state['refreshing'] and known is not None):
+            return known
+        generation_state['refreshing'] = True
+    generation = None
+    try:
+        conn, cursor = connect_sql()
+        try:
+            cursor.execute('SELECT MAX(Generation) FROM ImportInfo')
+            generation = cursor.fetchone()[0] or 0
+        except pymssql.Error:
+            generation = 0
+    finally:
+        # Also reached when connect_sql() aborts on a pool timeout, so the next request tries again
+        with generation_lock:
+            generation_state['refreshing'] = False
+            if generation is not None:
+                if generation != generation_state['generation']:
+                    response_cache.clear()
+                generation_state.update(generation=generation, checked=time.monotonic())
+    return generation
+
+
+def file_version(path):
+    '''
+    :return: modification time of path in nanoseconds, 0 for a missing file
+    '''
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def cached_on(*paths):
+    '''
+    Decorator of resources served from files the SQL generator writes next to the script, such as the opening
+    tree. Like cached(), but the cached results also expire when one of the files is rewritten.
+    '''
+    def decorator(handler):
+        return cached(handler, paths)
+    return decorator
+
+
+def cached(handler, paths=()):
+    '''
+    Resource method decorator. Serves the handler's result from response_cache, keyed on the request path
+    and query string, until the import generation changes. Successful responses carry the generation as
+    ETag, a client sending it back in If-None-Match gets 304 Not Modified without a payload.
+    :param paths: files the handler reads, see cached_on()
+    '''
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        generation = import_generation()
+        etag = '-'.join([str(generation)] + [str(file_version(path)) for path in paths])
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        key = (request.full_path, etag)
+        result = response_cache.get(key)
+        if result is None:
+            result = handler(*args, **kwargs)
+            response_cache.set(key, result)
+        if not isinstance(result, tuple):
+            result = (result, 200, {})
+        elif len(result) == 2:
+            result = result + ({},)
+        data, code, headers = result
+        if code != 200:
+            # ("Not found", 404) and other errors, not worth revalidating
+            return data, code, headers
+        return data, 200, dict(headers, ETag=f'"{etag}"')
+    return wrapper
+
+
+def json_value(value):
+    '''
+    Convert a column value for the JSON response. Games.Moves is the only binary column, returned as the
+    legacy string of coordinate pairs, or with ?moves=packed as the base64 of the stored 9 bit per move packing.
+    '''
+    if isinstance(value, datetime.date):
+        return str(value)
+    if isinstance(value, bytes):
+        if request.args.get('moves') == 'packed':
+            return base64.b64encode(value).decode('ascii')
+        return ''.join(SGFWrapper.decode_moves(value))
+    return value
+
+
 def sql_select_where_id(statement, id):
     conn, cursor = connect_sql()
     cursor.execute(statement, id)
     try:
-        data = next(cursor)
-        if len(data) == 14 and isinstance(data[12], datetime.date):
-            data = list(data)
-            data[12] = str(data[12])
+        data = [json_value(v) for v in next(cursor)]
         schema = [s[0] for s in cursor.description]
         return [schema] + [data]
     except StopIteration:
         return "Not found", 404
 
 
+def parse_id_list():
+    '''
+    Read the ids query argument, "1,2,3", of a batch request
+    :return: list of unique int IDs in request order
+    '''
+    ids_text = request.args.get('ids', '')
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids_text.split(',') if i.strip()))
+    except ValueError:
+        abort(400, message='ids must be a comma separated list of integers')
+    if len(ids) == 0:
+        abort(400, message='ids is required, e.g. ?ids=1,2,3')
+    if len(ids) > MAX_BATCH_IDS:
+        abort(400, message=f'At most {MAX_BATCH_IDS} ids per request')
+    return ids
+
+
+def sql_select_where_ids(table, ids):
+    '''
+    Batch form of sql_select_where_id(), resolves many IDs of table with one query
+    :return: [schema] + rows in the order of ids, IDs that do not exist are left out
+    '''
+    conn, cursor = connect_sql()
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(f'SELECT * FROM {table} WHERE Id IN ({placeholders})', tuple(ids))
+    schema = [s[0] for s in cursor.description]
+    rows_by_id = {}
+    for row in cursor:
+        rows_by_id[row[0]] = [json_value(v) for v in row]
+    return [schema] + [rows_by_id[i] for i in ids if i in rows_by_id]
+
+
+def parse_date_arg(name, value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        abort(400, message=f'{name} must be a date YYYY-MM-DD')
+
+
+def game_list_filters():
+    '''
+    Build the WHERE clauses for the filter and paging arguments of a game listing request
+        date_from, date_to      YYYY-MM-DD, inclusive
+        country                 Games.CountryId
+        result                  black, white or unknown
+        min_rank                both players at least this rank
+        after                   "Date,Id" of the last game of the previous page, from the X-Next-After header
+        limit                   page size, default DEFAULT_PAGE_SIZE
+    :return: (clauses, params, limit)
+    '''
+    args = request.args
+    clauses = []
+    params = []
+    try:
+        if 'date_from' in args:
+            clauses.append('Date >= %s')
+            params.append(parse_date_arg('date_from', args['date_from']))
+        if 'date_to' in args:
+            clauses.append('Date <= %s')
+            params.append(parse_date_arg('date_to', args['date_to']))
+        if 'country' in args:
+            clauses.append('CountryId = %s')
+            params.append(int(args['country']))
+        if 'result' in args:
+            if args['result'] not in RESULT_TO_WHOWON:
+                abort(400, message=f'result must be one of {", ".join(RESULT_TO_WHOWON)}')
+            clauses.append('WhoWonInt = %s')
+            params.append(RESULT_TO_WHOWON[args['result']])
+        if 'min_rank' in args:
+            clauses.append('BlackRank >= %s AND WhiteRank >= %s')
+            params += [int(args['min_rank'])] * 2
+        if 'after' in args:
+            after_date, after_id = args['after'].split(',')
+            after_date = parse_date_arg('after', after_date)
+            # Keyset paging, seeks straight to the page instead of skipping the rows of every page before it
+            clauses.append('(Date < %s OR (Date = %s AND Id < %s))')
+            params += [after_date, after_date, int(after_id)]
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(400, message='country, min_rank and limit must be integers, after must be "YYYY-MM-DD,Id"')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        abort(400, message=f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return clauses, params, limit
+
+
+def sql_select_game_page(key_columns=(), key_id=None):
+    '''
+    One page of a game listing, newest first
+    :param key_columns: columns that must equal key_id, e.g. ('EventsID',). Several columns are
+        alternatives, ('BlackId', 'WhiteId') lists the games of a player. Each alternative is a separate
+        seek on its own index and the results are merged, which stays fast where an OR would scan.
+    :return: ([schema] + rows, 200, headers), X-Next-After is set when there may be another page
+    '''
+    clauses, params, limit = game_list_filters()
+    if not key_columns:
+        branches = [(clauses, params)]
+    else:
+        branches = []
+        for idx, column in enumerate(key_columns):
+            # A game can only appear in one branch, also when it somehow has the same player on both sides
+            excluded = [f'{previous} <> %s' for previous in key_columns[:idx]]
+            branches.append(([f'{column} = %s'] + excluded + clauses, [key_id] * (idx + 1) + params))
+
+    selects = []
+    all_params = []
+    for branch_clauses, branch_params in branches:
+        where = f' WHERE {" AND ".join(branch_clauses)}' if branch_clauses else ''
+        selects.append(f'SELECT TOP {limit} {GAME_LIST_COLUMNS} FROM Games{where} {GAME_LIST_ORDER}')
+        all_params += branch_params
+    if len(selects) == 1:
+        statement = selects[0]
+    else:
+        statement = (f'SELECT TOP {limit} * FROM ('
+                     + ' UNION ALL '.join(f'SELECT * FROM ({select}) b{idx}' for idx, select in enumerate(selects))
+                     + f') g {GAME_LIST_ORDER}')
+
+    conn, cursor = connect_sql()
+    cursor.execute(statement, tuple(all_params))
+    schema = [s[0] for s in cursor.description]
+    rows = [[str(v) if isinstance(v, datetime.date) else v for v in row] for row in cursor]
+    headers = {}
+    if len(rows) == limit:
+        headers['X-Next-After'] = f'{rows[-1][1]},{rows[-1][0]}'
+    return [schema] + rows, 200, headers
+
+
+######################################
+# Position Search and Opening Tree
+
+index_file_lock = threading.Lock()
+index_files = {}    # path: (mtime, loaded file)
+
+
+def index_file(path, load, option):
+    '''
+    A file written by the SQL generator next to the script, loaded on first use and reloaded when an import rewrites it
+    :param load: function loading the file from path
+    :param option: generator option that writes the file, for the error message
+    :return: loaded file, aborts with 503 if it was never built
+    '''
+    with index_file_lock:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            abort(503, message=f'{path} not found, build it with 02_generate_sql_script_from_tgz.py {option}')
+        if path not in index_files or index_files[path][0] != mtime:
+            index_files[path] = (mtime, load(path))
+        return index_files[path][1]
+
+
+def position_index():
+    return index_file(POSITION_INDEX, PositionIndex.load, '--position-index')
+
+
+def opening_tree():
+    return index_file(OPENING_TREE, OpeningTreeFile, '--opening-tree')
+
+
+def parse_moves(text, name):
+    '''
+    Split SGF coordinate pairs, "pddpqd", "pd,dp,qd" or "pd/dp/qd"
+    :return: list of pairs
+    '''
+    text = text.replace(',', '').replace('/', '').lower()
+    pairs = [text[i:i + 2] for i in range(0, len(text), 2)]
+    if any(len(pair) != 2 or not ('a' <= pair[0] <= 't' and 'a' <= pair[1] <= 't') for pair in pairs):
+        abort(400, message=f'{name} must be SGF coordinate pairs, e.g. pddpqd')
+    return pairs
+
+
+def parse_move_arg(name):
+    return parse_moves(request.args.get(name, ''), name)
+
+
+def opening_node(tree, node, symmetry, moves):
+    '''
+    Describe an opening tree node, with the moves in the orientation of the query
+    '''
+    games = int(node['games'])
+    next_moves = [[tree.move_in_query_frame(child['move'], symmetry), int(child['games']),
+                   round(int(child['black_wins']) / int(child['games']), 4),
+                   round(int(child['white_wins']) / int(child['games']), 4)]
+                  for child in tree.children(node)]
+    next_moves.sort(key=lambda x: (-x[1], x[0]))
+    return dict(
+        moves=''.join(moves),
+        games=games,
+        black_wins=int(node['black_wins']),
+        white_wins=int(node['white_wins']),
+        black_win_rate=round(int(node['black_wins']) / max(games, 1), 4),
+        white_win_rate=round(int(node['white_wins']) / max(games, 1), 4),
+        top_players=[['PlayerId', 'Games']] + [[int(p), int(n)] for p, n in
+                                               zip(node['top_players'], node['top_player_games']) if n],
+        top_events=[['EventId', 'Games']] + [[int(e), int(n)] for e, n in
+                                             zip(node['top_events'], node['top_event_games']) if n],
+        next_moves=[['Move', 'Games', 'BlackWinRate', 'WhiteWinRate']] + next_moves,
+    )
+
+
 ######################################
 # Routes Setup
 
 class TournamentList(Resource):
+    method_decorators = [cached]
+
     def get(self):
         conn, cursor = connect_sql()
         cursor.execute('SELECT b.Id [BaseEventId], e.Id [EventId], e.Name [EventName], c.Id [CountryId] FROM Events e'
@@ -54,37 +427,246 @@ class TournamentList(Resource):
         schema = [s[0] for s in cursor.description]
         return [schema] + [row for row in cursor]
 
+class PoolStats(Resource):
+    def get(self):
+        return sql_pool.stats()
+
+class CacheStats(Resource):
+    def get(self):
+        return dict(generation=generation_state['generation'], **response_cache.stats())
+
+class Openings(Resource):
+    method_decorators = [cached_on(OPENING_TREE)]
+
+    def get(self, moves=''):
+        '''
+        Opening tree node of a move sequence, "pd/dp/qd" or "pddpqd", the same up to rotation and reflection
+        '''
+        pairs = parse_moves(moves, 'Moves')
+        tree = opening_tree()
+        found = tree.find(pairs)
+        if found is None:
+            return f'Played in fewer than {tree.min_games} games, or deeper than {tree.max_moves} moves', 404
+        return opening_node(tree, found[0], found[1], pairs)
+
+    post = get
+
+class PositionSearch(Resource):
+    method_decorators = [cached_on(POSITION_INDEX)]
+
+    def get(self):
+        '''
+        Games that reached a position, the same up to rotation, reflection and swapping the colours
+            moves           moves played from the empty board, black first, "tt" passes
+            black, white    stones added after the moves, to give a position directly
+            limit           game IDs returned, default DEFAULT_POSITION_GAMES
+        Next moves are given in the orientation of the query, most played first.
+        '''
+        moves = parse_move_arg('moves')
+        black = parse_move_arg('black')
+        white = parse_move_arg('white')
+        if not (moves or black or white):
+            abort(400, message='Give the position with moves, black and/or white')
+        try:
+            limit = int(request.args.get('limit', DEFAULT_POSITION_GAMES))
+        except ValueError:
+            abort(400, message='limit must be an integer')
+        if not 1 <= limit <= MAX_POSITION_GAMES:
+            abort(400, message=f'limit must be between 1 and {MAX_POSITION_GAMES}')
+        key = position_key(moves, black, white)
+        if key is None:
+            abort(400, message='Position has a stone played on an occupied point')
+        index = position_index()
+        if len(moves) > index.max_moves:
+            abort(400, message=f'Only the first {index.max_moves} moves of each game are indexed')
+        game_ids, next_moves = index.search(*key)
+        next_moves = sorted(next_moves.items(), key=lambda x: (-x[1], x[0]))
+        return dict(game_count=len(game_ids), games=game_ids[:limit],
+                    next_moves=[['Move', 'Games']] + [list(m) for m in next_moves])
+
 class Countries(Resource):
+    method_decorators = [cached]
+
     def post(self, country_id):
         return sql_select_where_id('SELECT * FROM Countries WHERE Id = %s', country_id)
 
+    get = post
+
 
 class BaseEvents(Resource):
+    method_decorators = [cached]
+
     def post(self, base_event_id):
         return sql_select_where_id('SELECT * FROM BaseEvents WHERE Id = %s', base_event_id)
 
+    get = post
+
 class Events(Resource):
+    method_decorators = [cached]
+
     def post(self, event_id):
         return sql_select_where_id('SELECT * FROM Events WHERE Id = %s', event_id)
 
+    get = post
+
 class Players(Resource):
+    method_decorators = [cached]
+
     def post(self, player_id):
         return sql_select_where_id('SELECT * FROM Players WHERE Id = %s', player_id)
 
+    get = post
+
+class PlayerStats(Resource):
+    method_decorators = [cached]
+
+    def get(self, player_id):
+        '''
+        Win and loss counts of a player precomputed by the import, by category, and the frequent opponents
+        '''
+        conn, cursor = connect_sql()
+        cursor.execute('SELECT Category, Value, Games, Wins, Losses FROM PlayerStats WHERE PlayerId = %s '
+                       'ORDER BY Category, Value', player_id)
+        schema = [s[0] for s in cursor.description][1:]
+        categories = {}
+        for row in cursor:
+            categories.setdefault(row[0], [schema]).append(list(row[1:]))
+        if not categories:
+            return "Not found", 404
+        cursor.execute('SELECT OpponentId, Games, Wins, Losses, FirstDate, LastDate FROM HeadToHead '
+                       'WHERE PlayerId = %s ORDER BY Games DESC, OpponentId', player_id)
+        schema = [s[0] for s in cursor.description]
+        return dict(player_id=player_id, stats=categories,
+                    head_to_head=[schema] + [[json_value(v) for v in row] for row in cursor])
+
+    post = get
+
+class HeadToHead(Resource):
+    method_decorators = [cached]
+
+    def get(self, player_id, opponent_id):
+        return sql_select_where_id('SELECT * FROM HeadToHead WHERE PlayerId = %s AND OpponentId = %s',
+                                   (player_id, opponent_id))
+
+    post = get
+
+class PlayerRating(Resource):
+    method_decorators = [cached]
+
+    def get(self, player_id):
+        return sql_select_where_id('SELECT * FROM Ratings WHERE PlayerId = %s', player_id)
+
+    post = get
+
+class PlayerRatingHistory(Resource):
+    method_decorators = [cached]
+
+    def get(self, player_id):
+        '''
+        Rating of a player after every day they played, oldest first
+        '''
+        conn, cursor = connect_sql()
+        cursor.execute('SELECT Date, Rating, Games FROM RatingHistory WHERE PlayerId = %s ORDER BY Date', player_id)
+        schema = [s[0] for s in cursor.description]
+        rows = [[json_value(v) for v in row] for row in cursor]
+        if not rows:
+            return "Not found", 404
+        return [schema] + rows
+
+    post = get
+
 class Games(Resource):
+    method_decorators = [cached]
+
     def post(self, game_id):
         return sql_select_where_id('SELECT * FROM Games WHERE Id = %s', game_id)
 
+    get = post
+
+
+class CountriesBatch(Resource):
+    method_decorators = [cached]
+
+    def get(self):
+        return sql_select_where_ids('Countries', parse_id_list())
+
+    post = get
+
+class BaseEventsBatch(Resource):
+    method_decorators = [cached]
+
+    def get(self):
+        return sql_select_where_ids('BaseEvents', parse_id_list())
+
+    post = get
+
+class EventsBatch(Resource):
+    method_decorators = [cached]
+
+    def get(self):
+        return sql_select_where_ids('Events', parse_id_list())
+
+    post = get
+
+class PlayersBatch(Resource):
+    method_decorators = [cached]
+
+    def get(self):
+        return sql_select_where_ids('Players', parse_id_list())
+
+    post = get
+
+class GameList(Resource):
+    method_decorators = [cached]
+
+    def get(self):
+        if 'ids' in request.args:
+            return sql_select_where_ids('Games', parse_id_list())
+        return sql_select_game_page()
+
+    post = get
+
+class EventGames(Resource):
+    method_decorators = [cached]
+
+    def get(self, event_id):
+        return sql_select_game_page(('EventsID',), event_id)
+
+    post = get
+
+class PlayerGames(Resource):
+    method_decorators = [cached]
+
+    def get(self, player_id):
+        return sql_select_game_page(('BlackId', 'WhiteId'), player_id)
+
+    post = get
+
 
 ######################################
 # API Setup
 
 api.add_resource(TournamentList, '/Tournaments/')
+api.add_resource(PoolStats, '/Pool/')
+api.add_resource(CacheStats, '/Cache/')
+api.add_resource(PositionSearch, '/Search/Position')
+api.add_resource(Openings, '/Openings/', '/Openings/<path:moves>')
 api.add_resource(Countries, '/Countries/<int:country_id>')
 api.add_resource(BaseEvents, '/BaseEvents/<int:base_event_id>')
 api.add_resource(Events, '/Events/<int:event_id>')
 api.add_resource(Players, '/Players/<int:player_id>')
 api.add_resource(Games, '/Games/<int:game_id>')
+api.add_resource(CountriesBatch, '/Countries')
+api.add_resource(BaseEventsBatch, '/BaseEvents')
+api.add_resource(EventsBatch, '/Events')
+api.add_resource(PlayersBatch, '/Players')
+api.add_resource(GameList, '/Games')
+api.add_resource(EventGames, '/Events/<int:event_id>/Games')
+api.add_resource(PlayerGames, '/Players/<int:player_id>/Games')
+api.add_resource(PlayerStats, '/Players/<int:player_id>/Stats')
+api.add_resource(HeadToHead, '/Players/<int:player_id>/vs/<int:opponent_id>')
+api.add_resource(PlayerRating, '/Players/<int:player_id>/Rating')
+api.add_resource(PlayerRatingHistory, '/Players/<int:player_id>/Rating/History')
 
 
 
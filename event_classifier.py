@@ -0,0 +1,185 @@
+import re
+import time
+import argparse
+from functools import lru_cache
+from sgf_wrapper import SGFWrapper
+from game_store import open_game_source
+
+# List of countries with code, abbreviation, full name
+COUNTRIES = [
+    (0, 'none', 'None'),
+    (1, 'cn', 'China'),
+    (2, 'kr', 'Korea'),
+    (3, 'jp', 'Japan'),
+    (4, 'tw', 'Taiwan'),
+]
+COUNTRY_IDS = {code: country_id for country_id, code, name in COUNTRIES}
+
+# Maps country full names to abbreviations
+COUNTRY_NAME_TO_ABBR = {
+    'Japanese': 'jp',
+    'Chinese': 'cn',
+    'Korean': 'kr',
+    'Taiwan': 'tw',
+}
+
+# Maps words in tournament name to host country, the first word in this order found in the name wins
+TOURNAMENT_COUNTRY = {
+    'Samsung': 'kr',
+    'LG Cup': 'kr',
+    'Toyota': 'jp',
+    'Changqi': 'cn',
+    'Fujitsu': 'jp',
+    'Chunlan': 'cn',
+    'Nongshim': 'kr',
+    'Jeongganjang': 'kr',
+    'Zhonghuan': 'tw',
+    'Korea': 'jp',
+    'Nogshim': 'kr',
+    'Hungchang': 'kr',
+    'Kansai': 'jp',
+    'Hiroshima': 'jp',
+    'NHK': 'jp',
+    'Myeongin': 'kr',
+    'Haojue': 'cn',
+    'China': 'cn',
+    'Kangwon': 'kr',
+    'Daiwa-Shoken': 'jp',
+}
+
+_EVENT = re.compile(r'(\d{1,2})(?:st|nd|rd|th)(.*)')
+_EVENT_COUNTRY = re.compile('|'.join(COUNTRY_NAME_TO_ABBR))
+# Every tournament word as one group of a single alternation. The lookahead matches at every position, so
+# words that overlap are all seen, and at each position the alternation tries the words in table order.
+_TOURNAMENT_COUNTRIES = list(TOURNAMENT_COUNTRY.values())
+_TOURNAMENT = re.compile('(?=' + '|'.join(f'({word})' for word in TOURNAMENT_COUNTRY) + ')', re.IGNORECASE)
+
+
+def country_code_to_id(code):
+    '''
+    Convert a country code 'jp' to id 3
+    :raises RuntimeError: unknown code
+    '''
+    try:
+        return COUNTRY_IDS[code]
+    except KeyError:
+        raise RuntimeError(f'Could not find COUNTRIES[{code}]')
+
+
+def decode_event(event):
+    '''
+    Possible event formats:
+        Ordinal   Country    Base Event Name
+            1st   Japanese   Meijin
+           22nd   Chinese    Mingren
+            5th              Asian TV Cup
+     Country Ord     base_name        event_name
+    ('jp', '1st', 'Japanese Meijin', '1st Japanese Meijin')
+    :return: (country_abbr, number, base_name, event_name)
+    '''
+    r = _EVENT.search(event)
+    if r is None:
+        return (None, None, None, None)  # could not decode
+    base_name = r.group(2).strip()
+    country = _EVENT_COUNTRY.search(base_name)
+    country_abbr = COUNTRY_NAME_TO_ABBR[country.group(0)] if country else 'none'
+    return (country_abbr, int(r.group(1)), base_name, r.group(0).strip())
+
+
+def tournament_country(base_name):
+    '''
+    :return: country code of the first TOURNAMENT_COUNTRY word found in base_name, ignoring case, or None
+    '''
+    found = [match.lastindex for match in _TOURNAMENT.finditer(base_name)]
+    return _TOURNAMENT_COUNTRIES[min(found) - 1] if found else None
+
+
+@lru_cache(maxsize=None)
+def classify_event(event):
+    '''
+    decode_event(), with the country taken from the tournament name when the event does not name one.
+    Memoized, an archive has a few thousand distinct EV values for hundreds of thousands of games.
+    :return: (country_abbr, number, base_name, event_name)
+    '''
+    country_abbr, number, base_name, event_name = decode_event(event)
+    if base_name is not None and country_abbr == 'none':
+        country_abbr = tournament_country(base_name) or country_abbr
+    return (country_abbr, number, base_name, event_name)
+
+
+def classify_event_by_search(event):
+    '''
+    The classification as the import did it before this module: uncompiled patterns, one search per
+    tournament word. Kept as the reference for benchmark().
+    '''
+    r = re.search(r'(\d{1,2}(?:st|nd|rd|th))(.*)', event)
+    try:
+        event_name = r.group(0).strip()
+        number = r.group(1).strip()
+        number = int(''.join([ch for ch in number if str.isdigit(ch)]))
+        base_name = r.group(2).strip()
+        r2 = re.search(r'((?:Japanese|Chinese|Korean|Taiwan))', base_name)
+        try:
+            country = r2.group(1).strip()
+        except AttributeError:
+            country = None
+    except AttributeError:
+        return (None, None, None, None)
+    try:
+        country_abbr = COUNTRY_NAME_TO_ABBR[country]
+    except KeyError:
+        country_abbr = 'none'
+    if country_abbr == 'none':
+        for k, v in TOURNAMENT_COUNTRY.items():
+            if re.search(k, base_name, re.IGNORECASE):
+                country_abbr = v
+                break
+    return (country_abbr, number, base_name, event_name)
+
+
+def benchmark(source_path, repeat=5):
+    '''
+    Classify the EV values of every game in source_path with classify_event_by_search() and with
+    classify_event(), print events per second and any event where the two disagree
+    :return: number of events that disagree
+    '''
+    events = []
+    for member_name, data in open_game_source(source_path):
+        if member_name.lower().endswith('.sgf'):
+            try:
+                events.append(SGFWrapper(data, member_name).tag_dict['EV'])
+            except RuntimeError:
+                pass
+    distinct = list(dict.fromkeys(events))
+    print(f'{len(events)} games, {len(distinct)} distinct events')
+
+    def timed(name, classify, names, clear_cache=False):
+        seconds = 0.0
+        for i in range(repeat):
+            if clear_cache:
+                classify_event.cache_clear()
+            start = time.perf_counter()
+            results = [classify(event) for event in names]
+            seconds += time.perf_counter() - start
+        print(f'{name:<36} {repeat * len(names) / max(seconds, 1e-9):>14,.0f} events/s')
+        return results
+
+    reference = timed('search per word, distinct events', classify_event_by_search, distinct)
+    timed('compiled, distinct events', classify_event.__wrapped__, distinct)
+    timed('search per word, every game', classify_event_by_search, events)
+    timed('compiled and memoized, every game', classify_event, events, clear_cache=True)
+    differences = [(event, expected, classify_event(event)) for event, expected in zip(distinct, reference)
+                   if classify_event(event) != expected]
+    for event, expected, found in differences[:20]:
+        print(f'Differs: {event!r}\n   search per word: {expected}\n   compiled:        {found}')
+    print(f'{len(differences)} of {len(distinct)} distinct events differ')
+    return len(differences)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark event classification over the events of an archive')
+    parser.add_argument('--input', default='./GoKifu.tgz',
+                        help='SGF files: TGZ, zip, harvester archive directory or plain directory')
+    parser.add_argument('--repeat', type=int, default=5, help='times each classification is timed')
+    args = parser.parse_args()
+    exit(1 if benchmark(args.input, args.repeat) else 0)
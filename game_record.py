@@ -0,0 +1,124 @@
+import sys
+import time
+import argparse
+import tracemalloc
+from sgf_wrapper import SGFWrapper, BLACK, WHITE
+from game_store import open_game_source
+
+
+class GameRecord(object):
+    '''
+    The parts of a parsed game the import keeps, in place of the SGFWrapper. Slots instead of a tag dictionary,
+    moves packed by SGFWrapper.encode_moves(), rank, winner and date decoded once into ints, and the strings
+    interned so the thousands of games of one player or event share a single copy of each name.
+    '''
+    __slots__ = ('black_name', 'white_name', 'black_country', 'white_country', 'black_rank', 'white_rank',
+                 'event', 'round', 'place', 'result', 'who_won', 'date', 'moves')
+    # Strings worth sharing between games
+    INTERNED = ('black_name', 'white_name', 'black_country', 'white_country', 'event', 'round', 'place', 'result')
+
+    @classmethod
+    def from_sgf(cls, sgf_game):
+        '''
+        :param sgf_game: SGFWrapper
+        :raises RuntimeError: undecodable date, or a move outside 'a' to 't'
+        '''
+        record = cls()
+        td = sgf_game.tag_dict
+        record.black_name = sys.intern(td['PB'])
+        record.white_name = sys.intern(td['PW'])
+        record.black_country = sys.intern(td['BC'])
+        record.white_country = sys.intern(td['WC'])
+        record.black_rank = sgf_game.get_player_rank(BLACK)
+        record.white_rank = sgf_game.get_player_rank(WHITE)
+        record.event = sys.intern(td['EV'])
+        record.round = sys.intern(td['RO'])
+        record.place = sys.intern(td['PC'])
+        record.result = sys.intern(td['RE'])
+        record.who_won = sgf_game.get_who_won()
+        # 'YYYY-MM-DD' as the int YYYYMMDD
+        record.date = int(sgf_game.get_date().replace('-', ''))
+        record.moves = sgf_game.get_packed_moves()
+        return record
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # Records come back from the parse workers pickled, intern again in this process
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, sys.intern(value) if name in self.INTERNED else value)
+
+    @property
+    def move_pair_list(self):
+        '''Moves unpacked into coordinate pairs, a new list on every call'''
+        return SGFWrapper.decode_moves(self.moves)
+
+    def get_date(self):
+        '''
+        :return: string 'YYYY-MM-DD'
+        '''
+        return f'{self.date // 10000:04}-{self.date // 100 % 100:02}-{self.date % 100:02}'
+
+    def get_who_won(self):
+        return self.who_won
+
+    def get_player_rank(self, stone_color):
+        '''
+        :raises RuntimeError: invalid stone_color, or StoneColor.NONE
+        '''
+        if stone_color == BLACK:
+            return self.black_rank
+        elif stone_color == WHITE:
+            return self.white_rank
+        raise RuntimeError(f'GameRecord.get_player_rank(): stone_color must be -1 or 1')
+
+    def get_packed_moves(self):
+        return self.moves
+
+
+def measure_memory(source_path, limit=None):
+    '''
+    Parse the SGF members of source_path and print the memory held per game by SGFWrapper objects
+    and by GameRecord objects, as traced by tracemalloc
+    :param limit: only the first limit games
+    :return: (bytes per SGFWrapper, bytes per GameRecord)
+    '''
+    sources = []
+    for member_name, data in open_game_source(source_path):
+        if member_name.lower().endswith('.sgf'):
+            sources.append((member_name, data))
+            if limit is not None and len(sources) == limit:
+                break
+
+    def parse_all(make):
+        games = []
+        for member_name, data in sources:
+            try:
+                games.append(make(SGFWrapper(data, member_name)))
+            except RuntimeError:
+                pass
+        return games
+
+    results = []
+    for name, make in (('SGFWrapper', lambda sgf_game: sgf_game), ('GameRecord', GameRecord.from_sgf)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        games = parse_all(make)
+        seconds = time.perf_counter() - start
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append(held / max(len(games), 1))
+        print(f'{name:<12} {len(games)} games, {held / 2**20:.2f} MB held, {results[-1]:,.0f} bytes per game, '
+              f'parsed in {seconds:.2f}s')
+        del games
+    return tuple(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory per game of SGFWrapper objects and GameRecord objects')
+    parser.add_argument('--input', default='./GoKifu.tgz',
+                        help='SGF files: TGZ, zip, harvester archive directory or plain directory')
+    parser.add_argument('--limit', type=int, help='only the first N games')
+    args = parser.parse_args()
+    measure_memory(args.input, args.limit)
@@ -0,0 +1,183 @@
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+
+SHARD_PREFIX = 'games-'
+SHARD_SIZE = 5000
+
+
+class DirectoryStore(object):
+    '''
+    One file per game in a directory, the original harvester layout
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def names(self):
+        return set(name for name in os.listdir(self.directory) if not name.endswith('.part'))
+
+    def add(self, name, data):
+        # Write to a temporary name first so an interrupted run never leaves a partial file behind
+        full_file_path = os.path.join(self.directory, name)
+        with open(full_file_path + '.part', 'wb') as fp:
+            fp.write(data)
+        os.replace(full_file_path + '.part', full_file_path)
+
+    def flush(self):
+        pass
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as fp:
+            return fp.read()
+
+    def __iter__(self):
+        for name in sorted(self.names()):
+            yield name, self.read(name)
+
+
+class ShardedZipStore(object):
+    '''
+    Games appended to a series of zip shards games-00001.zip, games-00002.zip, ... in a directory.
+    The shard being written is named .part and only renamed once it is closed, so a crash loses at most
+    the games added since the last flush(). Writing resumes in the last shard while it holds fewer than
+    shard_size games, appending to a .part copy of it that replaces the shard when closed, so frequent
+    flushes do not leave many small shards. The central directory of each shard gives random access by name.
+    :param remove_partial: delete a .part shard left by a crashed writer, only the writer should set this
+    '''
+    def __init__(self, directory, shard_size=SHARD_SIZE, remove_partial=False):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        # index[file name] = path of the shard holding it
+        self.index = {}
+        self.shard_paths = []
+        self.current = None
+        self.current_path = None
+        self.current_names = []
+        # Games already in the shard being written when it was reopened, and in the last closed shard
+        self.current_count = 0
+        self.last_shard_count = 0
+        os.makedirs(directory, exist_ok=True)
+        for shard_name in sorted(os.listdir(directory)):
+            if not shard_name.startswith(SHARD_PREFIX):
+                continue
+            shard_path = os.path.join(directory, shard_name)
+            if shard_name.endswith('.part'):
+                # Being written, or left over from a crash so its games were never recorded as harvested
+                if remove_partial:
+                    os.remove(shard_path)
+                continue
+            self.shard_paths.append(shard_path)
+            with zipfile.ZipFile(shard_path) as shard:
+                names = shard.namelist()
+            for name in names:
+                self.index[name] = shard_path
+            self.last_shard_count = len(names)
+
+    def names(self):
+        with self.lock:
+            return set(self.index) | set(self.current_names)
+
+    def add(self, name, data):
+        with self.lock:
+            if self.current is None:
+                self._open_shard()
+            self.current.writestr(name, data)
+            self.current_names.append(name)
+            if self.current_count + len(self.current_names) >= self.shard_size:
+                self._close_shard()
+
+    def flush(self):
+        '''Close the shard being written so every game added so far is durable'''
+        with self.lock:
+            self._close_shard()
+
+    def _open_shard(self):
+        if self.shard_paths and self.last_shard_count < self.shard_size:
+            # The closed shard stays readable and intact until the copy replaces it
+            self.current_path = self.shard_paths[-1]
+            self.current_count = self.last_shard_count
+            shutil.copyfile(self.current_path, self.current_path + '.part')
+            self.current = zipfile.ZipFile(self.current_path + '.part', 'a', zipfile.ZIP_DEFLATED)
+        else:
+            self.current_path = os.path.join(self.directory, f'{SHARD_PREFIX}{len(self.shard_paths) + 1:05}.zip')
+            self.current_count = 0
+            self.current = zipfile.ZipFile(self.current_path + '.part', 'w', zipfile.ZIP_DEFLATED)
+
+    def _close_shard(self):
+        if self.current is None:
+            return
+        self.current.close()
+        os.replace(self.current_path + '.part', self.current_path)
+        if self.current_path not in self.shard_paths:
+            self.shard_paths.append(self.current_path)
+        for name in self.current_names:
+            self.index[name] = self.current_path
+        self.last_shard_count = self.current_count + len(self.current_names)
+        self.current = None
+        self.current_path = None
+        self.current_names = []
+
+    def read(self, name):
+        with zipfile.ZipFile(self.index[name]) as shard:
+            return shard.read(name)
+
+    def __iter__(self):
+        for shard_path in self.shard_paths:
+            with zipfile.ZipFile(shard_path) as shard:
+                for info in shard.infolist():
+                    if not info.is_dir():
+                        yield info.filename, shard.read(info)
+
+
+class ZipSource(object):
+    '''
+    A single zip of game files
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, name):
+        with zipfile.ZipFile(self.path) as archive:
+            return archive.read(name)
+
+    def __iter__(self):
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, archive.read(info)
+
+
+class TarSource(object):
+    '''
+    A tar or gzip-tar of game files, such as the hand made GoKifu.tgz. Can only be read front to back.
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with tarfile.open(self.path, 'r:*') as tar_file:
+            for tarinfo in tar_file:
+                if tarinfo.isfile():
+                    yield tarinfo.name, tar_file.extractfile(tarinfo).read()
+
+
+def open_game_source(path):
+    '''
+    Open path for reading game files, picking the format from the path:
+        directory holding games-*.zip shards    ShardedZipStore written by the harvester
+        other directory                         DirectoryStore, one file per game
+        .zip                                    ZipSource
+        anything else                           TarSource (.tgz, .tar.gz, .tar)
+    :return: iterable of (file_name, file_bytes) in a stable order
+    '''
+    if os.path.isdir(path):
+        if any(name.startswith(SHARD_PREFIX) and name.endswith('.zip') for name in os.listdir(path)):
+            return ShardedZipStore(path)
+        return DirectoryStore(path)
+    if path.lower().endswith('.zip'):
+        return ZipSource(path)
+    return TarSource(path)
@@ -0,0 +1,213 @@
+import numpy as np
+from sgf_wrapper import BLACK, WHITE
+
+BOARD_SIZE = 19
+# Boards are stored flat with a border of one point all round, so the neighbours of a point are always
+# point - WIDTH, point + WIDTH, point - 1 and point + 1 with no bounds checks
+WIDTH = BOARD_SIZE + 2
+PADDED_POINTS = WIDTH * WIDTH
+OFFSETS = np.array([-WIDTH, WIDTH, -1, 1])
+
+# Point values of BoardBatch.color
+EMPTY = 0
+BLACK_STONE = 1
+WHITE_STONE = 2
+BORDER = 3
+
+# Moves that place no stone
+PASS_MOVE = -1
+END_MOVE = -2       # the game has no more moves
+
+# BoardBatch.error values
+LEGAL = 0
+OCCUPIED = 1
+KO = 2
+SUICIDE = 3
+ERROR_NAMES = {LEGAL: 'Legal', OCCUPIED: 'Move on occupied point', KO: 'Retakes ko', SUICIDE: 'Suicide'}
+
+DEFAULT_BATCH_SIZE = 4096
+
+
+def moves_to_points(move_pair_list):
+    '''
+    :param move_pair_list: SGF coordinate pairs, 'tt' or any pair off the board is a pass
+    :return: int16 array of padded points or PASS_MOVE
+    '''
+    xy = np.frombuffer(''.join(move_pair_list).encode('latin-1'), np.uint8).reshape(-1, 2).astype(np.int16) - 97
+    on_board = ((xy >= 0) & (xy < BOARD_SIZE)).all(1)
+    return np.where(on_board, (xy[:, 1] + 1) * WIDTH + xy[:, 0] + 1, PASS_MOVE).astype(np.int16)
+
+
+class BoardBatch(object):
+    '''
+    Boards of many games replayed in step, every call to play() makes one move in each game.
+    Each step is a fixed number of NumPy operations over the games, not a Python loop over them.
+
+    Groups are tracked incrementally. label holds the root point of the group of every stone, and
+    plibs[root] the pseudo liberties of the group: the number of (stone, empty neighbour) pairs,
+    which counts a liberty shared by several stones more than once but is zero exactly when the group
+    has no liberties. Placing a stone takes one pseudo liberty from each neighbouring group, joins
+    the friendly ones by adding their counts, and removing a captured stone gives one back to each
+    neighbouring group. Only joining two existing groups relabels stones.
+
+    A game stops at its first illegal move, recorded in error and error_move. Its board is left as it
+    was before that move, except that a suicide stays on the board.
+    '''
+    def __init__(self, game_count):
+        self.game_count = game_count
+        self.color = np.zeros((game_count, PADDED_POINTS), np.int8)
+        border = np.ones((WIDTH, WIDTH), bool)
+        border[1:-1, 1:-1] = False
+        self.color[:, border.ravel()] = BORDER
+        self.label = np.full((game_count, PADDED_POINTS), -1, np.int16)
+        self.plibs = np.zeros((game_count, PADDED_POINTS), np.int16)
+        self.ko = np.full(game_count, -1, np.int16)
+        self.alive = np.ones(game_count, bool)
+        self.error = np.zeros(game_count, np.int8)
+        self.error_move = np.full(game_count, -1, np.int32)
+        # captures[game] = (stones captured by black, stones captured by white)
+        self.captures = np.zeros((game_count, 2), np.int32)
+        self.move_number = 0
+
+    def play(self, points):
+        '''
+        Play the next move of every game, black moves first and the colours alternate
+        :param points: array of one padded point, PASS_MOVE or END_MOVE per game
+        '''
+        points = np.asarray(points)
+        color = BLACK_STONE if self.move_number % 2 == 0 else WHITE_STONE
+        other = BLACK_STONE + WHITE_STONE - color
+        move_number = self.move_number
+        self.move_number += 1
+
+        is_move = self.alive & (points >= 0)
+        # A pass ends any ko
+        self.ko[~is_move] = -1
+        rows = np.nonzero(is_move)[0]
+        if rows.size == 0:
+            return
+        # Work on flat views, a point of game g is g * PADDED_POINTS + point
+        color_f = self.color.reshape(-1)
+        label_f = self.label.reshape(-1)
+        plibs_f = self.plibs.reshape(-1)
+        pts = points[rows].astype(np.intp)
+        base = rows * PADDED_POINTS
+        at = base + pts
+        occupied = color_f[at] != EMPTY
+        retakes_ko = pts == self.ko[rows]
+        bad = occupied | retakes_ko
+        if bad.any():
+            self._fail(rows[bad], np.where(occupied[bad], OCCUPIED, KO), move_number)
+            rows = rows[~bad]
+            pts = pts[~bad]
+            base = base[~bad]
+            at = at[~bad]
+        self.ko[rows] = -1
+
+        neighbours = at[:, None] + OFFSETS
+        nb_color = color_f[neighbours]
+        # Flat root of each neighbouring group, meaningless where there is no stone
+        nb_root = base[:, None] + label_f[neighbours]
+
+        # Place the stone as a group of its own, every neighbouring group loses the edge to it
+        color_f[at] = color
+        label_f[at] = pts
+        plibs_f[at] = (nb_color == EMPTY).sum(1)
+        np.subtract.at(plibs_f, nb_root[(nb_color == BLACK_STONE) | (nb_color == WHITE_STONE)], 1)
+
+        # Join the friendly neighbouring groups, each counted once, into the group of the first one
+        roots = np.where(nb_color == color, nb_root, -2)
+        for d in range(1, 4):
+            roots[(roots[:, d:d + 1] == roots[:, :d]).any(1), d] = -2
+        joins = np.nonzero((roots >= 0).any(1))[0]
+        single_stone = np.ones(rows.size, bool)
+        single_stone[joins] = False
+        if joins.size:
+            join_roots = roots[joins]
+            valid = join_roots >= 0
+            keep = join_roots[np.arange(joins.size), np.argmax(valid, axis=1)]
+            join_plibs = np.where(valid, plibs_f[np.maximum(join_roots, 0)], 0).sum(1)
+            plibs_f[keep] = join_plibs + plibs_f[at[joins]]
+            label_f[at[joins]] = keep - base[joins]
+            others = np.where(join_roots == keep[:, None], -2, join_roots)
+            relabel = np.nonzero((others >= 0).any(1))[0]
+            if relabel.size:
+                # Two or more groups joined, relabel the stones of all but the first
+                boards = rows[joins[relabel]]
+                board_base = base[joins[relabel]][:, None]
+                others = np.where(others[relabel] >= 0, others[relabel] - board_base, -2)
+                labels = self.label[boards]
+                joined = labels == others[:, :1]
+                for d in range(1, 4):
+                    joined |= labels == others[:, d:d + 1]
+                self.label[boards] = np.where(joined, (keep[relabel] - board_base[:, 0])[:, None], labels)
+
+        # Capture the neighbouring enemy groups left without liberties
+        enemy = nb_color == other
+        dead = enemy & (plibs_f[np.where(enemy, nb_root, 0)] == 0)
+        if dead.any():
+            i, d = np.nonzero(dead)
+            boards = rows[i]
+            j, captured = np.nonzero(self.label[boards] == (nb_root[i, d] - base[i])[:, None])
+            # A group next to the stone on two sides is found twice
+            flat = np.unique(boards[j] * PADDED_POINTS + captured)
+            cap_boards = flat // PADDED_POINTS
+            color_f[flat] = EMPTY
+            label_f[flat] = -1
+            np.add.at(self.captures[:, color - 1], cap_boards, 1)
+            # Every group next to a captured stone gets the edge back, including the capturing group
+            cap_neighbours = flat[:, None] + OFFSETS
+            cap_nb_color = color_f[cap_neighbours]
+            stones = (cap_nb_color == BLACK_STONE) | (cap_nb_color == WHITE_STONE)
+            cap_base = np.broadcast_to((cap_boards * PADDED_POINTS)[:, None], stones.shape)
+            np.add.at(plibs_f, cap_base[stones] + label_f[cap_neighbours[stones]], 1)
+            # Ko: a lone stone that captured exactly one stone and has that point as its only liberty
+            counts = np.bincount(cap_boards, minlength=self.game_count)[rows]
+            ko = np.nonzero((counts == 1) & single_stone & (plibs_f[at] == 1))[0]
+            if ko.size:
+                self.ko[rows[ko]] = flat[np.searchsorted(cap_boards, rows[ko])] - base[ko]
+
+        # Suicide, the group of the new stone has no liberties after the captures
+        suicide = plibs_f[base + label_f[at]] == 0
+        if suicide.any():
+            self._fail(rows[suicide], SUICIDE, move_number)
+
+    def _fail(self, rows, error, move_number):
+        self.alive[rows] = False
+        self.error[rows] = error
+        self.error_move[rows] = move_number
+
+    def boards(self):
+        '''
+        :return: int8 array (games, 19, 19) indexed [game, y, x], BLACK, WHITE or 0 for empty
+        '''
+        color = self.color.reshape(-1, WIDTH, WIDTH)[:, 1:-1, 1:-1]
+        return np.select([color == BLACK_STONE, color == WHITE_STONE], [BLACK, WHITE], 0).astype(np.int8)
+
+
+def replay_games(move_lists, max_moves=None):
+    '''
+    Replay games together on one BoardBatch
+    :param move_lists: list of move_pair_list, one per game
+    :param max_moves: stop after this many moves, to get the boards of an earlier position
+    :return: BoardBatch after the last move of every game
+    '''
+    points = [moves_to_points(move_pair_list[:max_moves]) for move_pair_list in move_lists]
+    steps = max((len(p) for p in points), default=0)
+    matrix = np.full((len(points), steps), END_MOVE, np.int16)
+    for row, game_points in enumerate(points):
+        matrix[row, :len(game_points)] = game_points
+    batch = BoardBatch(len(points))
+    # Column order, so each step reads one contiguous column
+    for column in np.asfortranarray(matrix).T:
+        batch.play(column)
+    return batch
+
+
+def replay_in_batches(move_lists, batch_size=DEFAULT_BATCH_SIZE, max_moves=None):
+    '''
+    Replay any number of games, batch_size at a time so memory stays bounded
+    :return: iterator of (index of the first game of the batch, BoardBatch)
+    '''
+    for start in range(0, len(move_lists), batch_size):
+        yield start, replay_games(move_lists[start:start + batch_size], max_moves)
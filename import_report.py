@@ -0,0 +1,79 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class ImportReport(object):
+    '''
+    Per stage timers and counters of one import, written as JSON by --report so import performance can be
+    compared across runs and archive sizes.
+        stages[name] = [seconds, items]     time spent in a stage and the number of items it handled
+        counters[group][name] = count       rejects by reason and other tallies
+        info[name] = value                  run settings and totals
+    Stages timed in the parse workers add up the seconds of every worker, so with --workers they can
+    exceed the wall time.
+    '''
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.info = {}
+
+    def add(self, stage, seconds, items=1):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += items
+
+    @contextmanager
+    def stage(self, name, items=1):
+        '''Time the body of a with statement as one run of the stage'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, items)
+
+    def timed(self, stage, items):
+        '''
+        Yield the items of an iterable, adding the time spent producing each one to the stage,
+        so a lazy source or row generator is timed without the work of its consumer
+        '''
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start, 0)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def count(self, group, name, n=1):
+        counts = self.counters.setdefault(group, {})
+        counts[name] = counts.get(name, 0) + n
+
+    def seconds(self, stage):
+        return self.stages.get(stage, (0.0, 0))[0]
+
+    def as_dict(self):
+        wall_seconds = time.perf_counter() - self.start
+        return dict(
+            started_at=f'{self.started_at:%Y-%m-%d %H:%M:%S}',
+            wall_seconds=round(wall_seconds, 3),
+            info=self.info,
+            stages={name: dict(seconds=round(seconds, 3), items=items,
+                               ms_per_item=round(1000 * seconds / items, 4) if items else None,
+                               percent_of_wall=round(100 * seconds / max(wall_seconds, 1e-9), 1))
+                    for name, (seconds, items) in self.stages.items()},
+            counters={group: dict(sorted(counts.items(), key=lambda x: -x[1])) for group, counts in self.counters.items()},
+        )
+
+    def save(self, path):
+        '''Write the report, to a temporary name first'''
+        with open(path + '.tmp', mode='w', encoding='utf-8') as fp:
+            json.dump(self.as_dict(), fp, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
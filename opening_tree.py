@@ -0,0 +1,213 @@
+import os
+from collections import Counter
+import numpy as np
+from position_index import SYMMETRY_POINTS, INVERSE_SYMMETRY, move_to_point, point_to_move
+
+DEFAULT_MOVES = 20
+DEFAULT_MIN_GAMES = 2
+TOP = 3
+
+FILE_MAGIC = b'BGOTREE1'
+# Header after the magic: max_moves, min_games, node count, game count
+HEADER_DTYPE = np.dtype('<u8')
+HEADER_FIELDS = 4
+HEADER_BYTES = len(FILE_MAGIC) + HEADER_FIELDS * HEADER_DTYPE.itemsize
+
+# One node per opening sequence played in at least min_games games, in breadth first order so the
+# children of a node are the child_count nodes from first_child on, sorted by move
+NODE_DTYPE = np.dtype([
+    ('move', '<u2'),
+    ('child_count', '<u2'),
+    ('first_child', '<u4'),
+    ('games', '<u4'),
+    ('black_wins', '<u4'),
+    ('white_wins', '<u4'),
+    ('top_players', '<u4', (TOP,)),
+    ('top_player_games', '<u4', (TOP,)),
+    ('top_events', '<u4', (TOP,)),
+    ('top_event_games', '<u4', (TOP,)),
+])
+
+
+def game_dtype(max_moves):
+    '''Record of one game kept in the tree file, so an incremental import can rebuild the tree'''
+    return np.dtype([
+        ('game_id', '<u4'),
+        ('black_id', '<u4'),
+        ('white_id', '<u4'),
+        ('event_id', '<u4'),
+        ('who_won', 'i1'),
+        ('move_count', 'u1'),
+        ('moves', '<u2', (max_moves,)),
+    ])
+
+
+def canonical_points(move_pair_list):
+    '''
+    Orient a move sequence the same way as every rotation and reflection of it: the symmetry giving the
+    smallest sequence of points. The prefix of a canonical sequence is the canonical form of the prefix,
+    so the canonical sequences of all games form one tree.
+    :return: (tuple of points, symmetry used)
+    '''
+    points = [move_to_point(move) for move in move_pair_list]
+    return min((tuple(SYMMETRY_POINTS[s][p] for p in points), s) for s in range(8))
+
+
+class OpeningTree(object):
+    '''
+    Opening tree of the first max_moves moves of every game, built during an import.
+    File layout: FILE_MAGIC, header, NODE_DTYPE records, game_dtype(max_moves) records.
+    '''
+    def __init__(self, max_moves=DEFAULT_MOVES, min_games=DEFAULT_MIN_GAMES):
+        '''
+        :param min_games: leave out sequences played in fewer games, most long sequences are played once
+        :raises RuntimeError: max_moves above 255
+        '''
+        if not 1 <= max_moves <= 255:
+            raise RuntimeError(f'OpeningTree(): max_moves must be between 1 and 255')
+        self.max_moves = max_moves
+        self.min_games = min_games
+        # (canonical points, game ID, black ID, white ID, event ID, who won)
+        self.games = []
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load the games of an existing tree file, to add the games of an incremental import
+        :raises RuntimeError: not a tree file
+        '''
+        header, nodes, games = read_tree_file(path)
+        tree = cls(int(header[0]), int(header[1]))
+        for game in games:
+            tree.games.append((tuple(int(p) for p in game['moves'][:game['move_count']]), int(game['game_id']),
+                               int(game['black_id']), int(game['white_id']), int(game['event_id']),
+                               int(game['who_won'])))
+        return tree
+
+    def add_game(self, game_id, move_pair_list, black_id, white_id, event_id, who_won):
+        points, symmetry = canonical_points(move_pair_list[:self.max_moves])
+        self.games.append((points, game_id, black_id, white_id, event_id, who_won))
+
+    def build(self):
+        '''
+        :return: NODE_DTYPE array. Sorting the games by canonical sequence makes the games below every
+            node a contiguous run, so each node is computed from its run and split into child runs.
+        '''
+        games = sorted(self.games)
+        who_won = np.array([game[5] for game in games], np.int8)
+        black_wins = np.concatenate([[0], np.cumsum(who_won == 1)])
+        white_wins = np.concatenate([[0], np.cumsum(who_won == -1)])
+        nodes = []
+        # Breadth first queue of (node index, first game, end game, depth)
+        queue = [(0, 0, len(games), 0)]
+        nodes.append(self._node(games, 0, len(games), 0xFFFF, black_wins, white_wins))
+        for node_index, first, end, depth in queue:
+            children = []
+            if depth < self.max_moves:
+                start = first
+                # Games that end at this depth sort first
+                while start < end and len(games[start][0]) <= depth:
+                    start += 1
+                while start < end:
+                    move = games[start][0][depth]
+                    stop = start
+                    while stop < end and games[stop][0][depth] == move:
+                        stop += 1
+                    if stop - start >= self.min_games:
+                        children.append((move, start, stop))
+                    start = stop
+            nodes[node_index]['first_child'] = len(nodes)
+            nodes[node_index]['child_count'] = len(children)
+            for move, start, stop in children:
+                queue.append((len(nodes), start, stop, depth + 1))
+                nodes.append(self._node(games, start, stop, move, black_wins, white_wins))
+        return np.array([tuple(node[field] for field in NODE_DTYPE.names) for node in nodes], NODE_DTYPE)
+
+    @staticmethod
+    def _node(games, first, end, move, black_wins, white_wins):
+        run = games[first:end]
+        players = Counter(game[2] for game in run)
+        players.update(game[3] for game in run)
+        events = Counter(game[4] for game in run)
+        top_players = players.most_common(TOP)
+        top_events = events.most_common(TOP)
+        return dict(
+            move=move,
+            games=end - first,
+            black_wins=black_wins[end] - black_wins[first],
+            white_wins=white_wins[end] - white_wins[first],
+            top_players=[p for p, count in top_players] + [0] * (TOP - len(top_players)),
+            top_player_games=[count for p, count in top_players] + [0] * (TOP - len(top_players)),
+            top_events=[e for e, count in top_events] + [0] * (TOP - len(top_events)),
+            top_event_games=[count for e, count in top_events] + [0] * (TOP - len(top_events)),
+        )
+
+    def save(self, path):
+        '''Build the tree and write it with the games, to a temporary name first'''
+        nodes = self.build()
+        games = np.zeros(len(self.games), game_dtype(self.max_moves))
+        for index, (points, game_id, black_id, white_id, event_id, who_won) in enumerate(self.games):
+            games[index] = (game_id, black_id, white_id, event_id, who_won, len(points),
+                            points + (0,) * (self.max_moves - len(points)))
+        with open(path + '.tmp', 'wb') as fp:
+            fp.write(FILE_MAGIC)
+            np.array([self.max_moves, self.min_games, len(nodes), len(games)], HEADER_DTYPE).tofile(fp)
+            nodes.tofile(fp)
+            games.tofile(fp)
+        os.replace(path + '.tmp', path)
+        return len(nodes)
+
+
+def read_tree_file(path):
+    '''
+    Map a tree file into memory, nothing is read until it is used
+    :return: (header, nodes, games) arrays
+    :raises RuntimeError: not a tree file
+    '''
+    with open(path, 'rb') as fp:
+        if fp.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise RuntimeError(f'read_tree_file(): {path} is not an opening tree')
+    header = np.memmap(path, HEADER_DTYPE, 'r', len(FILE_MAGIC), (HEADER_FIELDS,))
+    max_moves, min_games, node_count, game_count = (int(v) for v in header)
+    nodes = np.memmap(path, NODE_DTYPE, 'r', HEADER_BYTES, (node_count,)) if node_count else \
+        np.zeros(0, NODE_DTYPE)
+    games_offset = HEADER_BYTES + node_count * NODE_DTYPE.itemsize
+    games = np.memmap(path, game_dtype(max_moves), 'r', games_offset, (game_count,)) if game_count else \
+        np.zeros(0, game_dtype(max_moves))
+    return header, nodes, games
+
+
+class OpeningTreeFile(object):
+    '''
+    Read side of an opening tree file for the Flask server, memory mapped so only the nodes looked at are paged in
+    '''
+    def __init__(self, path):
+        self.header, self.nodes, games = read_tree_file(path)
+        self.max_moves = int(self.header[0])
+        self.min_games = int(self.header[1])
+
+    def find(self, move_pair_list):
+        '''
+        :return: (node, symmetry from the query to the tree) or None if fewer than min_games games played it
+        '''
+        if len(move_pair_list) > self.max_moves or len(self.nodes) == 0:
+            return None
+        points, symmetry = canonical_points(move_pair_list)
+        node_index = 0
+        for point in points:
+            node = self.nodes[node_index]
+            first = int(node['first_child'])
+            moves = self.nodes['move'][first:first + int(node['child_count'])]
+            position = int(np.searchsorted(moves, point))
+            if position == len(moves) or moves[position] != point:
+                return None
+            node_index = first + position
+        return self.nodes[node_index], symmetry
+
+    def children(self, node):
+        first = int(node['first_child'])
+        return self.nodes[first:first + int(node['child_count'])]
+
+    @staticmethod
+    def move_in_query_frame(point, symmetry):
+        return point_to_move(SYMMETRY_POINTS[INVERSE_SYMMETRY[symmetry]][int(point)])
@@ -0,0 +1,249 @@
+import re
+import json
+import math
+import time
+import argparse
+import unicodedata
+from collections import Counter
+from sgf_wrapper import SGFWrapper
+from game_store import open_game_source
+
+# Pairs of names whose trigram sets have at least this Jaccard similarity are merge candidates
+DEFAULT_THRESHOLD = 0.7
+
+# Rank text some sources append to the name, '9p', '9 dan', '(2d)', '5 kyu'
+_RANK_SUFFIX = re.compile(r'\s*[(\[]?\s*(?<!\d)(?:[1-9]\s*(?:dan|pro|d|p)|(?:[1-9]|[12]\d|30)\s*(?:kyu|k))\s*[)\]]?\s*$')
+# Names some sources give unknown players, the number after them is all that tells the players apart
+_PLACEHOLDERS = {'player', 'black', 'white', 'unknown', 'anonymous', 'guest'}
+# Removed without a space, "O'Meien" and "Cho Hun-hyun" read the same written without them
+_JOINERS = re.compile(r"['`’.-]")
+_SEPARATORS = re.compile(r'[\W_]+')
+# Letters left out of the sound of a word, romanizations differ mostly in vowels, 'Kimu' and 'Kim'
+_SILENT = re.compile(r'[aeiouyhw]')
+
+
+def normalize_name(name):
+    '''
+    Key of a player name: accents of Latin letters and case folded, rank text dropped, punctuation and spacing
+    made uniform. 'Cho Chikun 9p' and 'cho  chikun' have the same key 'cho chikun'.
+    '''
+    text = unicodedata.normalize('NFKD', name)
+    # Accents are dropped from Latin letters only, the marks of other scripts tell names apart, 'ガ' is not 'カ'
+    kept = []
+    base = ''
+    for ch in text:
+        if not unicodedata.combining(ch):
+            base = ch
+        elif unicodedata.name(base, '').startswith('LATIN'):
+            continue
+        kept.append(ch)
+    text = unicodedata.normalize('NFKC', ''.join(kept)).casefold()
+    stripped = _RANK_SUFFIX.sub('', text)
+    # Rank text is kept when no name is left without it, 'Player 3p' and 'Player 3d' are different players
+    words = _SEPARATORS.sub(' ', stripped).split()
+    if words and not set(words) <= _PLACEHOLDERS:
+        text = stripped
+    text = _JOINERS.sub('', text)
+    return ' '.join(_SEPARATORS.sub(' ', text).split())
+
+
+def name_sound(key):
+    '''
+    Phonetic bucket of a normalized name: every word reduced to its first letter and the consonants after it,
+    in sorted order so family name order does not matter. 'kimu sujun' and 'sujun kim' are both 'km sjn'.
+    Words with digits or letters outside a to z are kept whole.
+    '''
+    sounds = []
+    for word in key.split():
+        if word.isascii() and word.isalpha():
+            word = word[0] + _SILENT.sub('', word[1:])
+            word = ''.join(ch for i, ch in enumerate(word) if i == 0 or ch != word[i - 1])
+        sounds.append(word)
+    return ' '.join(sorted(sounds))
+
+
+def name_trigrams(key):
+    '''Set of the three letter substrings of a normalized name with its words in sorted order'''
+    text = f' {" ".join(sorted(key.split()))} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def load_aliases(path):
+    '''
+    Read an alias table, a JSON object of canonical name: list of other spellings of that player
+        {"Kim Sujun": ["Kimu Sujun", "Sujun Kim"]}
+    :return: dictionary of normalized spelling: canonical name
+    :raises RuntimeError: a spelling listed for two players, or a canonical name listed as a spelling of another
+    '''
+    with open(path, encoding='utf-8') as fp:
+        table = json.load(fp)
+    aliases = {}
+    for canonical, spellings in table.items():
+        for spelling in spellings:
+            key = normalize_name(spelling)
+            if aliases.get(key, canonical) != canonical:
+                raise RuntimeError(f'load_aliases(): {spelling!r} is listed for {aliases[key]!r} and {canonical!r}')
+            aliases[key] = canonical
+    for canonical in table:
+        if aliases.get(normalize_name(canonical), canonical) != canonical:
+            raise RuntimeError(f'load_aliases(): {canonical!r} is also listed as a spelling of '
+                               f'{aliases[normalize_name(canonical)]!r}')
+    return aliases
+
+
+class PlayerNames(object):
+    '''
+    Resolves the PB/PW names of games to one name per player before player IDs are handed out. A name resolves
+    to the canonical name the alias table gives its key, else to the first name seen with the same key.
+    '''
+    def __init__(self, aliases=None):
+        '''
+        :param aliases: dictionary of normalized spelling: canonical name, see load_aliases()
+        '''
+        self.aliases = aliases or {}
+        self.names = {}         # normalized key: canonical name
+        self.resolved = {}      # name as written: canonical name
+        self.merged = 0         # distinct names that resolved to another name
+
+    def add_known(self, name):
+        '''Make name the canonical name of its key, for the players of an earlier import'''
+        self.names.setdefault(normalize_name(name), name)
+
+    def resolve(self, name):
+        try:
+            return self.resolved[name]
+        except KeyError:
+            pass
+        key = normalize_name(name)
+        canonical = self.aliases.get(key)
+        if canonical is None:
+            canonical = name
+        else:
+            key = normalize_name(canonical)
+        canonical = self.names.setdefault(key, canonical)
+        self.resolved[name] = canonical
+        if canonical != name:
+            self.merged += 1
+        return canonical
+
+
+class NameIndex(object):
+    '''
+    Finds the pairs of names that may be one player without comparing every pair. Similar spellings are found
+    through an inverted index of name_trigrams(): each name only indexes the prefix of its trigrams in rarest
+    first order that a name at the threshold must share, so only pairs with a rare trigram in common are compared.
+    Names that sound alike are found in the buckets of name_sound().
+    '''
+    def __init__(self, names):
+        '''
+        :param names: iterable of names, spellings with the same normalized key count as one
+        '''
+        self.names = {}
+        for name in names:
+            self.names.setdefault(normalize_name(name), name)
+        self.keys = list(self.names)
+
+    def candidates(self, threshold=DEFAULT_THRESHOLD):
+        '''
+        :return: list of (name, name, score, reason) sorted by score, highest first. Score is the Jaccard similarity of the
+            trigrams, reason 'spelling' for names at the threshold, 'sound' for names below it in the same
+            phonetic bucket. Names whose words with digits differ are never candidates, 'Player 12' and 'Player 120'.
+        '''
+        found = {}
+
+        def add(i, j, score, reason):
+            a, b = self.keys[i], self.keys[j]
+            if sorted(w for w in a.split() if not w.isalpha()) != sorted(w for w in b.split() if not w.isalpha()):
+                return
+            found[min(i, j), max(i, j)] = (score, reason)
+
+        trigrams = [name_trigrams(key) for key in self.keys]
+        sizes = [len(grams) for grams in trigrams]
+        frequency = Counter(gram for grams in trigrams for gram in grams)
+        postings = {}
+        # Smallest names first, so every name indexed before a name is at most its size
+        for i in sorted(range(len(trigrams)), key=sizes.__getitem__):
+            grams = trigrams[i]
+            ordered = sorted(grams, key=lambda gram: (frequency[gram], gram))
+            # A name with Jaccard similarity >= threshold shares at least threshold * len(grams) trigrams, so it
+            # shares one of the first len(grams) - ceil(threshold * len(grams)) + 1. Against a name no smaller,
+            # one probed later, it shares 2 * threshold / (1 + threshold) of them, so fewer need to be indexed.
+            probe = ordered[:len(ordered) - math.ceil(threshold * len(ordered)) + 1]
+            indexed = ordered[:len(ordered) - math.ceil(2 * threshold / (1 + threshold) * len(ordered)) + 1]
+            min_size = threshold * len(grams)
+            for j in set().union(*(postings.get(gram, ()) for gram in probe)):
+                if sizes[j] >= min_size:
+                    shared = len(grams & trigrams[j])
+                    score = shared / (len(grams) + sizes[j] - shared)
+                    if score >= threshold:
+                        add(i, j, score, 'spelling')
+            for gram in indexed:
+                postings.setdefault(gram, []).append(i)
+
+        # Names that sound the same but are spelled too differently, 'Lee Sedol' and 'Li Sedol'. Only names of the
+        # same number of words with half the trigram similarity, most short names have a common sound.
+        buckets = {}
+        for i, key in enumerate(self.keys):
+            buckets.setdefault(name_sound(key), []).append(i)
+        for bucket in buckets.values():
+            for n, i in enumerate(bucket):
+                for j in bucket[n + 1:]:
+                    if (i, j) not in found and len(self.keys[i].split()) == len(self.keys[j].split()):
+                        score = len(trigrams[i] & trigrams[j]) / len(trigrams[i] | trigrams[j])
+                        if score >= threshold / 2:
+                            add(i, j, score, 'sound')
+        pairs = [(self.names[self.keys[i]], self.names[self.keys[j]], score, reason)
+                 for (i, j), (score, reason) in found.items()]
+        return sorted(pairs, key=lambda pair: (-pair[2], pair[0], pair[1]))
+
+
+def find_candidates(source_path, aliases_path=None, threshold=DEFAULT_THRESHOLD, output_path=None):
+    '''
+    Resolve the player names of every game in source_path, print the candidate merges among the resulting
+    players with their game counts, and optionally write them as an alias table to review
+    :param output_path: write the alias table here, the existing table of aliases_path plus one entry per
+        candidate with the name of more games as the canonical name
+    :return: list of candidates, see NameIndex.candidates()
+    '''
+    resolver = PlayerNames(load_aliases(aliases_path) if aliases_path else None)
+    games = Counter()
+    for member_name, data in open_game_source(source_path):
+        if member_name.lower().endswith('.sgf'):
+            try:
+                tag_dict = SGFWrapper(data, member_name).tag_dict
+            except RuntimeError:
+                continue
+            games.update((resolver.resolve(tag_dict['PB']), resolver.resolve(tag_dict['PW'])))
+    print(f'{len(resolver.resolved)} distinct names, {len(games)} players after resolution '
+          f'({resolver.merged} names merged)')
+    start = time.perf_counter()
+    candidates = NameIndex(games).candidates(threshold)
+    print(f'{len(candidates)} candidate merges found in {time.perf_counter() - start:.3f}s')
+    for a, b, score, reason in candidates:
+        print(f'{score:5.2f} {reason:<8} {a!r} ({games[a]} games)  {b!r} ({games[b]} games)')
+    if output_path is not None:
+        table = {}
+        if aliases_path:
+            with open(aliases_path, encoding='utf-8') as fp:
+                table = json.load(fp)
+        for a, b, score, reason in candidates:
+            canonical, spelling = (a, b) if games[a] >= games[b] else (b, a)
+            table.setdefault(canonical, [])
+            if spelling not in table[canonical]:
+                table[canonical].append(spelling)
+        with open(output_path, mode='w', encoding='utf-8') as fp:
+            json.dump(table, fp, ensure_ascii=False, indent=4)
+        print(f'Alias table written to {output_path}, review it before passing it to --player-aliases')
+    return candidates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the player names of an archive that may be the same player')
+    parser.add_argument('--input', default='./GoKifu.tgz',
+                        help='SGF files: TGZ, zip, harvester archive directory or plain directory')
+    parser.add_argument('--aliases', metavar='PATH', help='alias table to resolve the names with first')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='trigram similarity from 0 to 1 for names to be candidates')
+    parser.add_argument('--output', metavar='PATH', help='write the candidates as an alias table to review')
+    args = parser.parse_args()
+    find_candidates(args.input, args.aliases, args.threshold, args.output)
@@ -0,0 +1,147 @@
+import os
+import numpy as np
+from sgf_wrapper import BLACK, WHITE
+
+# Head to head rows are kept for pairs of players with at least this many games together
+DEFAULT_MIN_HEAD_TO_HEAD_GAMES = 3
+
+# PlayerStats categories and what their Value column holds
+TOTAL = 'Total'                         # 0
+COLOR = 'Color'                         # BLACK or WHITE, the colour the player had
+YEAR = 'Year'                           # year of the game
+EVENT = 'Event'                         # Events.Id
+OPPONENT_COUNTRY = 'OpponentCountry'    # Countries.Id of the opponent
+
+# Categories counted as games are added, by their code in the saved file. OPPONENT_COUNTRY is summed from the
+# pair counts when the rows are produced, so a player whose country becomes known moves to the right country.
+COUNTED_CATEGORIES = (TOTAL, COLOR, YEAR, EVENT)
+
+COUNT_DTYPE = np.dtype([
+    ('player_id', '<i4'),
+    ('category', 'u1'),
+    ('value', '<i4'),
+    ('games', '<i4'),
+    ('wins', '<i4'),
+    ('losses', '<i4'),
+])
+
+PAIR_DTYPE = np.dtype([
+    ('player_id', '<i4'),
+    ('opponent_id', '<i4'),
+    ('games', '<i4'),
+    ('wins', '<i4'),
+    ('losses', '<i4'),
+    ('first_date', 'S10'),
+    ('last_date', 'S10'),
+])
+
+
+class PlayerStats(object):
+    '''
+    Win and loss counts per player, materialized at import time into the PlayerStats and HeadToHead tables.
+    Games are counted as they are added, (game ID, black ID, white ID, who won, date 'YYYY-MM-DD', event ID), into
+    one counter per player and category value and one per ordered pair of players, so memory depends on the
+    number of players and pairs rather than games. The counters are saved between runs, an incremental import
+    loads them, adds its games and rewrites the rows of the players it touched.
+    '''
+    def __init__(self):
+        self.counts = {}        # (player ID, category, value): [games, wins, losses]
+        self.pairs = {}         # (player ID, opponent ID): [games, wins, losses, first date, last date]
+        self.touched = set()    # players of the games added since the counters were created or loaded
+        self.last_game_id = 0
+
+    def add_game(self, game_id, black_id, white_id, who_won, date, event_id):
+        counts = self.counts
+        pairs = self.pairs
+        year = int(date[:4])
+        for player_id, color, opponent_id in ((black_id, BLACK, white_id), (white_id, WHITE, black_id)):
+            # 1 won, -1 lost, 0 no result
+            result = who_won * color
+            for key in ((player_id, TOTAL, 0), (player_id, COLOR, color), (player_id, YEAR, year),
+                        (player_id, EVENT, event_id)):
+                entry = counts.get(key)
+                if entry is None:
+                    entry = counts[key] = [0, 0, 0]
+                entry[0] += 1
+                if result > 0:
+                    entry[1] += 1
+                elif result < 0:
+                    entry[2] += 1
+            entry = pairs.get((player_id, opponent_id))
+            if entry is None:
+                entry = pairs[player_id, opponent_id] = [0, 0, 0, date, date]
+            entry[0] += 1
+            if result > 0:
+                entry[1] += 1
+            elif result < 0:
+                entry[2] += 1
+            if date < entry[3]:
+                entry[3] = date
+            if date > entry[4]:
+                entry[4] = date
+        self.touched.update((black_id, white_id))
+        self.last_game_id = max(self.last_game_id, game_id)
+
+    def affected_players(self, changed_countries=()):
+        '''
+        Players whose rows change with the games added since the counters were loaded: the players of those
+        games, and the opponents of players whose country changed
+        '''
+        affected = set(self.touched)
+        changed_countries = set(changed_countries)
+        if changed_countries:
+            affected.update(player_id for player_id, opponent_id in self.pairs if opponent_id in changed_countries)
+        return affected
+
+    def player_rows(self, player_countries, player_ids=None):
+        '''
+        :param player_countries: dictionary of player ID: country ID
+        :param player_ids: only compute the rows of these players, default all
+        :return: sorted list of (player ID, category, value, games, wins, losses)
+        '''
+        rows = [key + tuple(value) for key, value in self.counts.items()
+                if player_ids is None or key[0] in player_ids]
+        by_country = {}     # (player ID, OPPONENT_COUNTRY, country ID): [games, wins, losses]
+        for (player_id, opponent_id), value in self.pairs.items():
+            if player_ids is not None and player_id not in player_ids:
+                continue
+            entry = by_country.setdefault((player_id, OPPONENT_COUNTRY, player_countries.get(opponent_id, 0)),
+                                          [0, 0, 0])
+            entry[0] += value[0]
+            entry[1] += value[1]
+            entry[2] += value[2]
+        rows.extend(key + tuple(value) for key, value in by_country.items())
+        return sorted(rows)
+
+    def head_to_head_rows(self, min_games=DEFAULT_MIN_HEAD_TO_HEAD_GAMES, player_ids=None):
+        '''
+        :param player_ids: only the pairs with one of these players, default all
+        :return: sorted list of (player ID, opponent ID, games, wins, losses, first date, last date),
+            one row for each order of every pair with at least min_games games
+        '''
+        return sorted(key + tuple(value) for key, value in self.pairs.items()
+                      if value[0] >= min_games and
+                      (player_ids is None or key[0] in player_ids or key[1] in player_ids))
+
+    def save(self, path):
+        '''Write the counters, to a temporary name first'''
+        counts = np.array([(player_id, COUNTED_CATEGORIES.index(category), value, *entry)
+                           for (player_id, category, value), entry in self.counts.items()], COUNT_DTYPE)
+        pairs = np.array([key + tuple(entry) for key, entry in self.pairs.items()], PAIR_DTYPE)
+        with open(path + '.tmp', 'wb') as fp:
+            np.savez(fp, counts=counts, pairs=pairs, last_game_id=np.int64(self.last_game_id))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load the counters written by save(), the loaded games do not count as touched
+        '''
+        stats = cls()
+        with np.load(path) as saved:
+            for player_id, category, value, games, wins, losses in saved['counts'].tolist():
+                stats.counts[player_id, COUNTED_CATEGORIES[category], value] = [games, wins, losses]
+            for player_id, opponent_id, games, wins, losses, first_date, last_date in saved['pairs'].tolist():
+                stats.pairs[player_id, opponent_id] = [games, wins, losses, first_date.decode(), last_date.decode()]
+            stats.last_game_id = int(saved['last_game_id'])
+        return stats
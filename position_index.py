@@ -0,0 +1,232 @@
+import os
+import random
+from array import array
+from bisect import bisect_left, bisect_right
+
+BOARD_SIZE = 19
+POINTS = BOARD_SIZE * BOARD_SIZE
+PASS = POINTS               # next move of a position where the game passed
+NO_MOVE = 0xFFFF            # next move of the last indexed position of a game that ended there
+DEFAULT_MOVES = 60
+
+FILE_MAGIC = b'BGOPOS1\0'
+
+# The 8 symmetries of the board as functions of (x, y)
+SYMMETRIES = [
+    lambda x, y: (x, y),
+    lambda x, y: (18 - x, y),
+    lambda x, y: (x, 18 - y),
+    lambda x, y: (18 - x, 18 - y),
+    lambda x, y: (y, x),
+    lambda x, y: (18 - y, x),
+    lambda x, y: (y, 18 - x),
+    lambda x, y: (18 - y, 18 - x),
+]
+# SYMMETRY_POINTS[s][point] = point after symmetry s, the pass maps to itself
+SYMMETRY_POINTS = [[y * BOARD_SIZE + x for x, y in (f(p % BOARD_SIZE, p // BOARD_SIZE) for p in range(POINTS))] + [PASS]
+                   for f in SYMMETRIES]
+# Rotations 5 and 6 undo each other, every other symmetry is its own inverse
+INVERSE_SYMMETRY = [0, 1, 2, 3, 4, 6, 5, 7]
+
+# Zobrist keys ZOBRIST[color][point], color 0 black and 1 white. Fixed seed, index files depend on these values.
+_random = random.Random(19)
+ZOBRIST = [[_random.getrandbits(64) for point in range(POINTS)] for color in range(2)]
+
+NEIGHBOURS = [[q for q in (p - BOARD_SIZE, p + BOARD_SIZE, p - 1 if p % BOARD_SIZE else -1,
+                           p + 1 if p % BOARD_SIZE != BOARD_SIZE - 1 else -1) if 0 <= q < POINTS]
+              for p in range(POINTS)]
+
+
+def move_to_point(move):
+    '''
+    :param move: SGF coordinate pair 'pd', 'tt' or any pair outside the board is a pass
+    :return: point index y * 19 + x, or PASS
+    '''
+    x = ord(move[0]) - 97
+    y = ord(move[1]) - 97
+    if 0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE:
+        return y * BOARD_SIZE + x
+    return PASS
+
+
+def point_to_move(point):
+    if point == PASS:
+        return 'tt'
+    return chr(97 + point % BOARD_SIZE) + chr(97 + point // BOARD_SIZE)
+
+
+class PositionHasher(object):
+    '''
+    Plays moves on a board with captures and keeps the Zobrist hash of the position under all 8 symmetries
+    and both colour assignments. The smallest of the 16 is the normalized key, equal for positions that
+    are the same up to rotation, reflection and swapping the colours.
+    '''
+    def __init__(self):
+        self.board = [-1] * POINTS      # -1 empty, 0 black, 1 white
+        self.hashes = [0] * 16          # hashes[symmetry * 2 + swap]
+        self.color = 0
+
+    def place(self, point, color):
+        self.board[point] = color
+        self._toggle(point, color)
+
+    def remove(self, point):
+        self._toggle(point, self.board[point])
+        self.board[point] = -1
+
+    def _toggle(self, point, color):
+        hashes = self.hashes
+        for s in range(8):
+            p = SYMMETRY_POINTS[s][point]
+            hashes[2 * s] ^= ZOBRIST[color][p]
+            hashes[2 * s + 1] ^= ZOBRIST[1 - color][p]
+
+    def play(self, point):
+        '''
+        Play the next move, alternating colours starting with black
+        :return: False if the point is occupied, the record cannot be replayed past it
+        '''
+        color = self.color
+        self.color = 1 - color
+        if point == PASS:
+            return True
+        if self.board[point] != -1:
+            return False
+        self.place(point, color)
+        for q in NEIGHBOURS[point]:
+            if self.board[q] == 1 - color:
+                self._capture_if_dead(q)
+        # Suicide, allowed by some rule sets
+        self._capture_if_dead(point)
+        return True
+
+    def _capture_if_dead(self, point):
+        color = self.board[point]
+        group = [point]
+        seen = {point}
+        for p in group:
+            for q in NEIGHBOURS[p]:
+                if self.board[q] == -1:
+                    return
+                if self.board[q] == color and q not in seen:
+                    seen.add(q)
+                    group.append(q)
+        for p in group:
+            self.remove(p)
+
+    def key(self):
+        '''
+        :return: (normalized key, symmetry that produced it)
+        '''
+        best = min(range(16), key=self.hashes.__getitem__)
+        return self.hashes[best], best // 2
+
+
+def position_entries(move_pair_list, max_moves=DEFAULT_MOVES):
+    '''
+    Normalized keys of the positions after each of the first max_moves moves
+    :return: list of (key, next move) with the next move in the frame of the normalized position,
+        PASS, or NO_MOVE after the last move of the game
+    '''
+    points = [move_to_point(move) for move in move_pair_list[:max_moves + 1]]
+    hasher = PositionHasher()
+    entries = []
+    for index, point in enumerate(points[:max_moves]):
+        if not hasher.play(point):
+            break
+        key, symmetry = hasher.key()
+        next_move = SYMMETRY_POINTS[symmetry][points[index + 1]] if index + 1 < len(points) else NO_MOVE
+        entries.append((key, next_move))
+    return entries
+
+
+def position_key(move_pair_list=(), black=(), white=()):
+    '''
+    Normalized key of the position reached by playing move_pair_list, then adding the setup stones
+    :return: (key, symmetry) or None if a move or stone is on an occupied point
+    '''
+    hasher = PositionHasher()
+    for move in move_pair_list:
+        if not hasher.play(move_to_point(move)):
+            return None
+    for color, moves in ((0, black), (1, white)):
+        for move in moves:
+            point = move_to_point(move)
+            if point == PASS or hasher.board[point] != -1:
+                return None
+            hasher.place(point, color)
+    return hasher.key()
+
+
+class PositionIndex(object):
+    '''
+    Position index built during an import: every (key, game ID, next move) entry, sorted by key in one file.
+        header      FILE_MAGIC, uint64 max_moves, uint64 entry count
+        keys        uint64 array
+        game ids    uint32 array
+        next moves  uint16 array
+    Arrays are in native byte order. A lookup is a binary search on keys.
+    '''
+    def __init__(self, max_moves=DEFAULT_MOVES):
+        self.max_moves = max_moves
+        self.keys = array('Q')
+        self.game_ids = array('I')
+        self.next_moves = array('H')
+
+    @classmethod
+    def load(cls, path):
+        '''
+        :raises RuntimeError: not an index file
+        '''
+        with open(path, 'rb') as fp:
+            if fp.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise RuntimeError(f'PositionIndex.load(): {path} is not a position index')
+            header = array('Q')
+            header.fromfile(fp, 2)
+            index = cls(header[0])
+            index.keys.fromfile(fp, header[1])
+            index.game_ids.fromfile(fp, header[1])
+            index.next_moves.fromfile(fp, header[1])
+        return index
+
+    def add_game(self, game_id, move_pair_list):
+        for key, next_move in position_entries(move_pair_list, self.max_moves):
+            self.keys.append(key)
+            self.game_ids.append(game_id)
+            self.next_moves.append(next_move)
+
+    def save(self, path):
+        '''
+        Sort the entries by key and write them, to a temporary name first. The sort is stable and games
+        are added in ID order, so entries with the same key stay in game ID order.
+        '''
+        order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+        with open(path + '.tmp', 'wb') as fp:
+            fp.write(FILE_MAGIC)
+            array('Q', [self.max_moves, len(order)]).tofile(fp)
+            array('Q', (self.keys[i] for i in order)).tofile(fp)
+            array('I', (self.game_ids[i] for i in order)).tofile(fp)
+            array('H', (self.next_moves[i] for i in order)).tofile(fp)
+        os.replace(path + '.tmp', path)
+
+    def search(self, key, symmetry):
+        '''
+        Games that reached a position, as returned by position_key()
+        :return: (sorted game IDs, {next move in the frame of the query: game count})
+        '''
+        first = bisect_left(self.keys, key)
+        last = bisect_right(self.keys, key, first)
+        games = set()
+        next_moves = {}
+        to_query = SYMMETRY_POINTS[INVERSE_SYMMETRY[symmetry]]
+        for i in range(first, last):
+            game_id = self.game_ids[i]
+            next_move = self.next_moves[i]
+            # A game can pass through the same position twice, count it once
+            if game_id in games:
+                continue
+            games.add(game_id)
+            if next_move != NO_MOVE:
+                move = point_to_move(to_query[next_move])
+                next_moves[move] = next_moves.get(move, 0) + 1
+        return sorted(games), next_moves
@@ -0,0 +1,204 @@
+import os
+import numpy as np
+
+INITIAL_RATING = 1500.0
+DEFAULT_K = 20.0
+
+# Games without a result (WhoWonInt 0) are not rated, a draw cannot be told from an unknown result
+RESULT_SCORES = {1: 1.0, -1: 0.0}
+
+# Game results as the import keeps them between runs, see add_games()
+GAME_RESULT_DTYPE = np.dtype([
+    ('game_id', '<i4'),
+    ('black_id', '<i4'),
+    ('white_id', '<i4'),
+    ('who_won', 'i1'),
+    ('date', 'S10'),
+    ('event_id', '<i4'),
+])
+
+HISTORY_DTYPE = np.dtype([
+    ('player_id', '<i4'),
+    ('date', '<U10'),
+    ('rating', '<f8'),
+    ('games', '<i4'),
+])
+
+
+class RatingEngine(object):
+    '''
+    Elo ratings over the game history, rated in date order. The expected score of black,
+    1 / (1 + 10 ** ((white rating - black rating) / 400)), is the Bradley-Terry model on the Elo scale.
+
+    Games of the same date form one rating period: every game of the day is rated from the ratings at the
+    start of the day and the changes are applied together, so a day is a handful of NumPy operations over
+    its games rather than a Python loop. The timeline keeps the rating and game count of a player after
+    every day they played.
+
+    Adding games dated before the last rated day replays history from the first added date, starting from
+    the ratings the timeline held the day before, so the timeline is always the one a full recompute gives.
+
+    Between imports only the ratings and game counts as of the last rated day are kept, see save_state(). An engine
+    loaded from them rates games dated after that day straight on. A game dated on or before it needs the ratings of
+    an earlier day, so the engine then starts over from the stored game history, see add_games().
+    '''
+    def __init__(self, k=DEFAULT_K, initial_rating=INITIAL_RATING):
+        self.k = k
+        self.initial_rating = initial_rating
+        self._clear()
+
+    def _clear(self):
+        self.black = np.zeros(0, np.int32)
+        self.white = np.zeros(0, np.int32)
+        self.score = np.zeros(0)
+        self.dates = np.zeros(0, '<U10')
+        # Ratings and game counts by player ID, as of the last rated day
+        self.ratings = np.zeros(0)
+        self.games = np.zeros(0, np.int32)
+        self.history = np.zeros(0, HISTORY_DTYPE)
+        self.last_date = None       # last rated day
+        self.last_game_id = 0       # highest game ID added, rated or not
+        # Last rated day of the state loaded by load_state(), the timeline only starts after it
+        self.resumed_from = None
+        # Ratings and game counts on that day, what a rewind to a date after it starts from
+        self.base_ratings = np.zeros(0)
+        self.base_games = np.zeros(0, np.int32)
+
+    def add_games(self, game_results, history=None):
+        '''
+        :param game_results: GAME_RESULT_DTYPE array, or iterable of
+            (game ID, black ID, white ID, who won, date 'YYYY-MM-DD', event ID)
+        :param history: function returning a GAME_RESULT_DTYPE array of every game added before the state was saved,
+            called when the engine was loaded by load_state() and a game is dated on or before its last rated day.
+            The engine then starts over and rates that history before the games.
+        :return: first date whose timeline changed, None if no rated game was added
+        :raises RuntimeError: a game needs the history and history is not given
+        '''
+        if not isinstance(game_results, np.ndarray):
+            game_results = np.array([(game_id, black_id, white_id, who_won, date.encode('ascii'), event_id)
+                                     for game_id, black_id, white_id, who_won, date, event_id in game_results],
+                                    GAME_RESULT_DTYPE)
+        if len(game_results):
+            self.last_game_id = max(self.last_game_id, int(game_results['game_id'].max()))
+        rated = game_results[np.isin(game_results['who_won'], list(RESULT_SCORES))]
+        if not len(rated):
+            return None
+        dates = rated['date'].astype('<U10')
+        if self.resumed_from is not None and min(dates.tolist()) <= self.resumed_from:
+            if history is None:
+                raise RuntimeError(f'RatingEngine.add_games(): a game dated {min(dates.tolist())} needs the game '
+                                   f'history up to {self.resumed_from}')
+            last_game_id = self.last_game_id
+            self._clear()
+            self.add_games(history())
+            self.last_game_id = max(self.last_game_id, last_game_id)
+        self.black = np.concatenate([self.black, rated['black_id'].astype(np.int32)])
+        self.white = np.concatenate([self.white, rated['white_id'].astype(np.int32)])
+        self.score = np.concatenate([self.score, np.where(rated['who_won'] > 0, RESULT_SCORES[1], RESULT_SCORES[-1])])
+        self.dates = np.concatenate([self.dates, dates])
+        since = min(dates.tolist())
+        self._rewind(since)
+        self._rate(since)
+        return since
+
+    def _rewind(self, since):
+        '''Drop the timeline from since on and restore the ratings it held before since'''
+        player_count = int(max(self.black.max(), self.white.max())) + 1
+        if len(self.history) and self.history['date'][-1] >= since:
+            self.history = self.history[self.history['date'] < since]
+            self.ratings = np.full(max(player_count, len(self.base_ratings)), self.initial_rating)
+            self.games = np.zeros(len(self.ratings), np.int32)
+            self.ratings[:len(self.base_ratings)] = self.base_ratings
+            self.games[:len(self.base_games)] = self.base_games
+            # History is in date order, the last entry of each player is its rating before since
+            last = self.last_entries()
+            self.ratings[last['player_id']] = last['rating']
+            self.games[last['player_id']] = last['games']
+        elif player_count > len(self.ratings):
+            self.ratings = np.concatenate([self.ratings, np.full(player_count - len(self.ratings), self.initial_rating)])
+            self.games = np.concatenate([self.games, np.zeros(player_count - len(self.games), np.int32)])
+
+    def _rate(self, since):
+        replay = np.nonzero(self.dates >= since)[0]
+        replay = replay[np.argsort(self.dates[replay], kind='stable')]
+        black = self.black[replay]
+        white = self.white[replay]
+        score = self.score[replay]
+        days, starts = np.unique(self.dates[replay], return_index=True)
+        ends = np.append(starts[1:], len(replay))
+        ratings = self.ratings
+        games = self.games
+        parts = [self.history]
+        for day, start, end in zip(days, starts, ends):
+            b = black[start:end]
+            w = white[start:end]
+            expected = 1.0 / (1.0 + 10.0 ** ((ratings[w] - ratings[b]) / 400.0))
+            change = self.k * (score[start:end] - expected)
+            np.add.at(ratings, b, change)
+            np.subtract.at(ratings, w, change)
+            np.add.at(games, b, 1)
+            np.add.at(games, w, 1)
+            played = np.unique(np.concatenate([b, w]))
+            part = np.empty(len(played), HISTORY_DTYPE)
+            part['player_id'] = played
+            part['date'] = day
+            part['rating'] = ratings[played]
+            part['games'] = games[played]
+            parts.append(part)
+        self.history = np.concatenate(parts)
+        if len(days):
+            self.last_date = max(self.last_date or '', str(days[-1]))
+
+    def save_state(self, path):
+        '''Write the ratings and game counts as of the last rated day, to a temporary name first'''
+        with open(path + '.tmp', 'wb') as fp:
+            np.savez(fp, ratings=self.ratings, games=self.games, last_date=np.array(self.last_date or ''),
+                     last_game_id=np.int64(self.last_game_id), k=np.float64(self.k),
+                     initial_rating=np.float64(self.initial_rating))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load_state(cls, path):
+        '''
+        Load the state written by save_state(), without the timeline of the days before
+        '''
+        with np.load(path) as saved:
+            engine = cls(float(saved['k']), float(saved['initial_rating']))
+            engine.ratings = saved['ratings']
+            engine.games = saved['games']
+            engine.last_date = str(saved['last_date']) or None
+            engine.last_game_id = int(saved['last_game_id'])
+        engine.resumed_from = engine.last_date
+        engine.base_ratings = engine.ratings.copy()
+        engine.base_games = engine.games.copy()
+        return engine
+
+    def last_entries(self):
+        '''
+        :return: HISTORY_DTYPE array of the last timeline entry of every rated player, by player ID
+        '''
+        reverse = self.history[::-1]
+        players, index = np.unique(reverse['player_id'], return_index=True)
+        return reverse[index]
+
+    def players_since(self, since):
+        '''IDs of the players with a timeline entry on or after since'''
+        return set(self.history['player_id'][self.history['date'] >= since].tolist())
+
+    def rating_rows(self, player_ids=None):
+        '''
+        :param player_ids: only these players, default all rated players
+        :return: list of (player ID, rating, games, last date) sorted by player ID
+        '''
+        return [(player_id, round(rating), games, date)
+                for player_id, date, rating, games in self.last_entries().tolist()
+                if player_ids is None or player_id in player_ids]
+
+    def history_rows(self, since=None):
+        '''
+        :param since: only the entries on or after this date, default all
+        :return: list of (player ID, date, rating, games) sorted by player ID and date
+        '''
+        history = self.history if since is None else self.history[self.history['date'] >= since]
+        history = history[np.lexsort((history['date'], history['player_id']))]
+        return [(player_id, date, round(rating), games) for player_id, date, rating, games in history.tolist()]
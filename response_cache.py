@@ -0,0 +1,49 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    In-process least recently used cache with a time to live per entry, safe to share between request threads.
+    Any object with the same get/set/clear/stats methods can be used as the backend instead,
+    e.g. a wrapper around memcached or redis when several server processes should share one cache.
+    '''
+    def __init__(self, max_entries=10000, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> (expires, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        :return: cached value, or None if missing or expired
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return dict(entries=len(self.entries), max_entries=self.max_entries, ttl=self.ttl,
+                        hits=self.hits, misses=self.misses)
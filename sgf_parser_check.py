@@ -0,0 +1,100 @@
+import os
+import time
+import random
+import argparse
+from sgf_wrapper import SGFWrapper
+from game_store import open_game_source
+
+# Small records covering the shapes and damage found in real archives: variations, escapes, passes, setup stones,
+# text around the game, several games in a file, bad moves, truncation and undecodable bytes
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sgf_fixtures')
+
+# The SGFWrapper scanner and the sgf package path it replaced
+PARSERS = (
+    ('scanner', lambda data: SGFWrapper(data, '')),
+    ('sgf package', lambda data: SGFWrapper(SGFWrapper.parse(data), '')),
+)
+
+
+def mutate(data, rnd):
+    '''
+    Damage an SGF record the way truncated or hand edited files are damaged
+    :return: bytes with one truncation, deletion or insertion
+    '''
+    position = rnd.randrange(len(data) + 1)
+    operation = rnd.randrange(4)
+    if operation == 0:
+        return data[:position]
+    if operation == 1:
+        return data[:position] + data[position + 1:]
+    if operation == 2:
+        insert = rnd.choice([b'(', b')', b'[', b']', b';', b'\\', b' ', b'B', b'W', b'x'])
+    else:
+        insert = rnd.choice([b'(;W[aa])', b';B[cc]', b'[zz]', b'C[)(]', b'B[abc]'])
+    return data[:position] + insert + data[position:]
+
+
+def parse_result(parse, data):
+    '''
+    :return: (tag_dict, move_pair_list) or the RuntimeError message
+    '''
+    try:
+        sgf_game = parse(data)
+        return sgf_game.tag_dict, sgf_game.move_pair_list
+    except RuntimeError as e:
+        return str(e)
+
+
+def time_parsers(records):
+    '''
+    Parse every record with each of PARSERS
+    :param records: list of SGF file bytes
+    :return: list of (parser name, seconds, list of parse_result() per record)
+    '''
+    timings = []
+    for name, parse in PARSERS:
+        start = time.perf_counter()
+        results = [parse_result(parse, data) for data in records]
+        timings.append((name, time.perf_counter() - start, results))
+    return timings
+
+
+def compare_parsers(source_path=FIXTURES, mutations=0, seed=19):
+    '''
+    Parse every SGF member of source_path with the scanner and with the sgf package, print the files
+    whose tags, moves or error differ and the files per second of both
+    :param mutations: also compare this many damaged copies of every file, see mutate()
+    :return: number of files that differ
+    '''
+    rnd = random.Random(seed)
+    records = []
+    for member_name, data in open_game_source(source_path):
+        if member_name.lower().endswith('.sgf'):
+            records.append((member_name, data))
+            records.extend((f'{member_name} (mutation {i + 1})', mutate(data, rnd)) for i in range(mutations))
+    timings = time_parsers([data for member_name, data in records])
+    for name, seconds, results in timings:
+        print(f'{name:<12} {len(records)} files in {seconds:.2f}s, {len(records) / max(seconds, 1e-9):,.0f} files/s')
+    differences = 0
+    for (member_name, data), scanned, parsed in zip(records, timings[0][2], timings[1][2]):
+        if scanned != parsed:
+            differences += 1
+            if differences <= 20:
+                print(f'Differs: {member_name}\n   scanner:     {scanned}\n   sgf package: {parsed}')
+    rejected = sum(isinstance(scanned, str) and isinstance(parsed, str)
+                   for scanned, parsed in zip(timings[0][2], timings[1][2]))
+    print(f'{len(records)} files compared, {rejected} rejected by both, {differences} differ')
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the SGF scanner of sgf_wrapper.py with the sgf package '
+                                                 'parser, results and files per second')
+    parser.add_argument('--input', default=FIXTURES,
+                        help='SGF files: TGZ, zip, harvester archive directory or plain directory, '
+                             'default the records in sgf_fixtures')
+    parser.add_argument('--mutations', type=int, default=0,
+                        help='also compare N damaged copies of every file, to cover malformed records')
+    parser.add_argument('--seed', type=int, default=19, help='random seed of the damaged copies')
+    args = parser.parse_args()
+    exit(1 if compare_parsers(args.input, args.mutations, args.seed) else 0)
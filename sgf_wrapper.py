@@ -5,6 +5,33 @@ BLACK = 1
 NONE = 0
 WHITE = -1
 
+# Packed moves: each move is a 9 bit point index y * 20 + x over the coordinates 'a' to 't',
+# so 'tt' (pass) is 399. Games.Moves stores the packed bytes, 9 bits a move instead of 2 UTF-16 characters.
+MOVE_BITS = 9
+MOVE_COORDINATES = 20
+
+# Native scanner, see SGFWrapper._scan(). _SGF_FILE accepts exactly the texts the state machine of sgf.Parser
+# accepts: anything up to the first '(', then game trees of nodes and properties, unbalanced ')' allowed.
+_WS = r'[ \t\r\n]'
+_VALUE = r'\[[^\\\]]*(?:\\.[^\\\]]*)*\]'
+_PROPERTY = rf'[A-Z]+{_VALUE}(?:{_WS}*{_VALUE})*{_WS}*'
+_NODE = rf';{_WS}*(?:{_PROPERTY})*'
+_OPEN = rf'\({_WS}*{_NODE}'
+_SGF_FILE = re.compile(rf'[^(]*{_OPEN}(?:{_NODE}|{_OPEN}|\)[ \t\r\n)]*{_OPEN})*\)[ \t\r\n)]*', re.DOTALL)
+# A root node followed by single move nodes and no variations, the common case
+_MOVE_NODE_TEXT = rf';{_WS}*([BW])\[([^\\\]]*)\]{_WS}*'
+_SIMPLE_FILE = re.compile(rf'[^(]*\({_WS}*;{_WS}*(?:{_PROPERTY})*((?:{_MOVE_NODE_TEXT})*)\)[ \t\r\n)]*', re.DOTALL)
+_MOVE_NODE = re.compile(_MOVE_NODE_TEXT)
+# The main line is every node before the first ')' outside a property value: after it only other variations
+# or other games follow
+_MAIN_LINE = re.compile(rf'[^(]*\((?:[^\[)]+|{_VALUE})*', re.DOTALL)
+# (';', '', '') node start, ('', identifier, first value) property, ('', '', '') any further value of a property
+_TOKEN = re.compile(rf'(;)|([A-Z]+)\[([^\\\]]*(?:\\.[^\\\]]*)*)\]|{_VALUE}', re.DOTALL)
+_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+# Move coordinates encode_moves() can pack, checked when the moves are read so a game with a move outside
+# 'a' to 't' is rejected by the parse, not when its row is written
+_COORDINATES = re.compile(r'[a-tA-T]*')
+
 def invert(color):
     return color * -1
 
@@ -29,22 +56,26 @@ class SGFWrapper(object):
             'KM': '',   # komi                  '6.5'
             'RE': '',   # result                'B+R'
         }
-        self.tag_key_list = self.tag_dict.keys()
+        self.tag_key_list = tuple(self.tag_dict.keys())
         self.sgf_file_name = sgf_file_name
         self.move_pair_list = []
         self.why_invalid = None
         self._extracted_date = None
         self._who_won = None
 
-        # Parse the file into a game collection
-        try:
-            game_collection = sgf.parse(sgf_file_text)
-        except sgf.ParseException as e:
-            raise RuntimeError(f'SGFWrapper.__init__(): parse error of SGF record [{e}]')
-        except UnboundLocalError as e:
-            raise RuntimeError(f'SGFWrapper.__init__(): parse error of SGF record (UnboundLocalError) [{e}]')
+        # Scan the text, or walk the game collection if the caller has already parsed it with parse()
+        if isinstance(sgf_file_text, sgf.Collection):
+            self._read_collection(sgf_file_text)
+        else:
+            self._scan(sgf_file_text)
 
-        # Walk nodes
+    # -------------------------------------------------------------------------
+
+    def _read_collection(self, game_collection):
+        """
+        Read the tags and main line moves of the first game of a collection built by the sgf package
+        :raises RuntimeError: missing or invalid move
+        """
         try:
             node = game_collection[0].root
             last_move_color = WHITE
@@ -61,7 +92,7 @@ class SGFWrapper(object):
                 if color_letter not in node.properties:
                     raise RuntimeError(f'SGFWrapper.__init__(): Color error during parse')
                 node_len = len(node.properties[color_letter][0])
-                if node_len == 2:
+                if node_len == 2 and _COORDINATES.fullmatch(node.properties[color_letter][0]):
                     self.move_pair_list.append(node.properties[color_letter][0].lower())
                 elif node_len == 0:
                     self.move_pair_list.append('tt')
@@ -72,9 +103,149 @@ class SGFWrapper(object):
         except IndexError:
             raise RuntimeError(f'SGFWrapper.__init__(): index error while parsing')
 
+    def _scan(self, sgf_file_text):
+        """
+        Read the tags and main line moves straight from the text, with the same result as
+        _read_collection(parse(sgf_file_text)) but without building node objects. Most records are a root
+        node and a line of single move nodes: one regular expression checks such a record, and its moves are
+        read with one findall. Other records are checked with the full syntax and the nodes of the main line
+        are read property by property. Texts the sgf package rejects go through parse() so the error is the same.
+        :param sgf_file_text: str, or raw bytes as read from a file or tar member (decoded as utf-8)
+        :raises RuntimeError: undecodable bytes, parse error, missing or invalid move
+        """
+        if isinstance(sgf_file_text, bytes):
+            try:
+                sgf_file_text = sgf_file_text.decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise RuntimeError(f'SGFWrapper.parse(): could not decode SGF record [{e}]')
+        root_start = sgf_file_text.find('(')
+
+        simple = _SIMPLE_FILE.fullmatch(sgf_file_text)
+        if simple is not None:
+            moves_start, moves_end = simple.span(1)
+            last_move_color = self._read_nodes(_TOKEN.findall(sgf_file_text, root_start, moves_start))
+            move_nodes = _MOVE_NODE.findall(sgf_file_text, moves_start, moves_end)
+            if move_nodes:
+                colors, moves = zip(*move_nodes)
+                colors = ''.join(colors)
+                expected = ('BW' if last_move_color == WHITE else 'WB') * (len(colors) // 2 + 1)
+                if colors == expected[:len(colors)] and set(map(len, moves)) <= {0, 2} and \
+                        _COORDINATES.fullmatch(''.join(moves)):
+                    self.move_pair_list.extend(move.lower() if move else 'tt' for move in moves)
+                else:
+                    # Let the node by node reading raise the error
+                    self._read_nodes(_TOKEN.findall(sgf_file_text, moves_start, moves_end), last_move_color)
+            return
+
+        if _SGF_FILE.fullmatch(sgf_file_text) is None:
+            self._read_collection(self.parse(sgf_file_text))
+            return
+        main_line_end = _MAIN_LINE.match(sgf_file_text).end()
+        self._read_nodes(_TOKEN.findall(sgf_file_text, root_start, main_line_end))
+
+    def _read_nodes(self, tokens, last_move_color=WHITE):
+        """
+        Read tags and moves from the _TOKEN matches of a run of main line nodes
+        :param last_move_color: color of the move before the first node
+        :return: color of the last move
+        :raises RuntimeError: missing or invalid move
+        """
+        black = white = None
+        # A ';' closes the node before it, the None at the end closes the last node
+        for semicolon, key, value in tokens + [(None, None, None)]:
+            if key:
+                # The last occurrence of a property in a node wins, as in the node dictionary of the sgf package
+                if key == 'B':
+                    black = value
+                elif key == 'W':
+                    white = value
+                elif key in self.tag_dict:
+                    self.tag_dict[key] = spaces(_ESCAPE.sub(r'\1', value) if '\\' in value else value)
+                continue
+            if semicolon == '':
+                # Further value of a property, only the first is used
+                continue
+            if black is not None or white is not None:
+                move = black if last_move_color == WHITE else white
+                if move is None:
+                    raise RuntimeError(f'SGFWrapper.__init__(): Color error during parse')
+                if '\\' in move:
+                    move = _ESCAPE.sub(r'\1', move)
+                if len(move) == 2 and _COORDINATES.fullmatch(move):
+                    self.move_pair_list.append(move.lower())
+                elif len(move) == 0:
+                    self.move_pair_list.append('tt')
+                else:
+                    raise RuntimeError(f'SGFWrapper.__init__(): Invalid move during parse')
+                last_move_color = invert(last_move_color)
+                black = white = None
+        return last_move_color
+
     # -------------------------------------------------------------------------
 
+    @staticmethod
+    def parse(sgf_file_text):
+        """
+        Parse the text of an SGF record into a game collection
+        :param sgf_file_text: str, or raw bytes as read from a file or tar member (decoded as utf-8)
+        :return: sgf.Collection
+        :raises RuntimeError: undecodable bytes, or parse error of SGF record
+        """
+        if isinstance(sgf_file_text, bytes):
+            try:
+                sgf_file_text = sgf_file_text.decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise RuntimeError(f'SGFWrapper.parse(): could not decode SGF record [{e}]')
+        try:
+            return sgf.parse(sgf_file_text)
+        except sgf.ParseException as e:
+            raise RuntimeError(f'SGFWrapper.parse(): parse error of SGF record [{e}]')
+        except UnboundLocalError as e:
+            raise RuntimeError(f'SGFWrapper.parse(): parse error of SGF record (UnboundLocalError) [{e}]')
+
+    # -------------------------------------------------------------------------
 
+    @staticmethod
+    def encode_moves(move_pair_list):
+        """
+        Pack a list of coordinate pairs into 9 bits per move, most significant bit first
+        :param move_pair_list: ['pd', 'dp', 'tt', ...]
+        :return: bytes, the last byte padded with zero bits
+        :raises RuntimeError: coordinate outside 'a' to 't'
+        """
+        bits = 0
+        for move in move_pair_list:
+            if len(move) != 2:
+                raise RuntimeError(f'SGFWrapper.encode_moves(): invalid move "{move}"')
+            x = ord(move[0]) - 97
+            y = ord(move[1]) - 97
+            if not 0 <= x < MOVE_COORDINATES or not 0 <= y < MOVE_COORDINATES:
+                raise RuntimeError(f'SGFWrapper.encode_moves(): invalid move "{move}"')
+            bits = (bits << MOVE_BITS) | (y * MOVE_COORDINATES + x)
+        bit_count = MOVE_BITS * len(move_pair_list)
+        byte_count = (bit_count + 7) // 8
+        return (bits << (8 * byte_count - bit_count)).to_bytes(byte_count, 'big')
+
+    @staticmethod
+    def decode_moves(packed):
+        """
+        Unpack the bytes of encode_moves(). The padding is always less than 8 bits, so the move count
+        is the number of whole 9 bit groups.
+        :param packed: bytes
+        :return: list of coordinate pairs
+        """
+        move_count = 8 * len(packed) // MOVE_BITS
+        bits = int.from_bytes(packed, 'big') >> (8 * len(packed) - MOVE_BITS * move_count)
+        move_pair_list = []
+        for shift in range(MOVE_BITS * (move_count - 1), -1, -MOVE_BITS):
+            y, x = divmod((bits >> shift) & ((1 << MOVE_BITS) - 1), MOVE_COORDINATES)
+            move_pair_list.append(chr(97 + x) + chr(97 + y))
+        return move_pair_list
+
+    def get_packed_moves(self):
+        return self.encode_moves(self.move_pair_list)
+
+    # -------------------------------------------------------------------------
 
     def is_valid_for_database_import(self):
         self.why_invalid = None
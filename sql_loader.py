@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import time
+
+
+class DatabaseLoader(object):
+    '''
+    Loads rows straight into SQL Server over a DB-API connection, instead of writing a script to run by hand.
+    Rows are sent as parameterized multi row INSERT statements through executemany, so nothing is escaped
+    into SQL text, and committed every commit_rows rows so no transaction grows without bound.
+    '''
+    # SQL Server allows 2100 parameters in one statement and 1000 rows in one VALUES list
+    max_parameters = 2000
+    max_rows = 1000
+    placeholder = '%s'
+
+    def __init__(self, conn, commit_rows=50000, statements_per_batch=10):
+        '''
+        :param conn: DB-API connection, not in autocommit mode
+        :param commit_rows: commit after about this many rows
+        :param statements_per_batch: multi row INSERT statements handed to one executemany call
+        '''
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.commit_rows = commit_rows
+        self.statements_per_batch = statements_per_batch
+        self.uncommitted = 0
+        self.commits = 0
+        # table_stats[table] = [rows, seconds]
+        self.table_stats = {}
+
+    def create_table(self, ddl):
+        self.execute(ddl)
+        self.commit()
+
+    def execute(self, statement, params=()):
+        self.cursor.execute(statement, params)
+
+    def update(self, statement, param_rows):
+        '''
+        Run statement once per row of parameters, e.g. UPDATE ... WHERE Id = %s
+        '''
+        # pymssql only takes a tuple or a dictionary of parameters, not a list
+        param_rows = [tuple(row) for row in param_rows]
+        if param_rows:
+            self.cursor.executemany(statement, param_rows)
+            self._written(len(param_rows))
+
+    def insert(self, table, columns, rows, identity=True):
+        '''
+        Insert rows, each a sequence of values in the order of columns, keeping the Id values given
+        :param identity: the table has an IDENTITY Id column
+        '''
+        start = time.perf_counter()
+        per_statement = max(1, min(self.max_rows, self.max_parameters // len(columns)))
+        row_placeholders = '(' + ', '.join([self.placeholder] * len(columns)) + ')'
+
+        def statement(row_count):
+            return f'INSERT INTO {table} ({", ".join(columns)}) VALUES ' + ', '.join([row_placeholders] * row_count)
+
+        full_statement = statement(per_statement)
+        if identity:
+            self._identity_insert(table, 'ON')
+        batch = []      # parameters of one full statement each
+        params = []
+        count = 0
+        for row in rows:
+            # pymssql quotes bytes as a varchar literal, which SQL Server will not convert to VARBINARY,
+            # and a bytearray as a 0x literal
+            params.extend(bytearray(v) if isinstance(v, bytes) else v for v in row)
+            count += 1
+            if len(params) == per_statement * len(columns):
+                # pymssql only takes a tuple or a dictionary of parameters, not a list
+                batch.append(tuple(params))
+                params = []
+                if len(batch) == self.statements_per_batch:
+                    self.cursor.executemany(full_statement, batch)
+                    self._written(len(batch) * per_statement)
+                    batch = []
+        if batch:
+            self.cursor.executemany(full_statement, batch)
+            self._written(len(batch) * per_statement)
+        if params:
+            self.execute(statement(len(params) // len(columns)), tuple(params))
+            self._written(len(params) // len(columns))
+        if identity:
+            self._identity_insert(table, 'OFF')
+        self.commit()
+        stats = self.table_stats.setdefault(table, [0, 0.0])
+        stats[0] += count
+        stats[1] += time.perf_counter() - start
+
+    def commit(self):
+        self.conn.commit()
+        self.commits += 1
+        self.uncommitted = 0
+
+    def close(self):
+        self.conn.close()
+
+    def print_summary(self):
+        print(f'Loaded in {self.commits} transactions')
+        for table, (rows, seconds) in self.table_stats.items():
+            print(f'   {table:<12} {rows:>10} rows {seconds:>8.2f}s {rows / max(seconds, 1e-9):>10.0f} rows/s')
+
+    def _written(self, row_count):
+        self.uncommitted += row_count
+        if self.uncommitted >= self.commit_rows:
+            self.commit()
+
+    def _identity_insert(self, table, state):
+        self.execute(f'SET IDENTITY_INSERT {table} {state}')
+
+
+class SQLiteLoader(DatabaseLoader):
+    '''
+    The same loader on a SQLite file, a local stand-in for SQL Server when testing an import
+    '''
+    # Parameter limit of SQLite builds before 3.32
+    max_parameters = 999
+    placeholder = '?'
+
+    def __init__(self, path, commit_rows=50000, statements_per_batch=10):
+        super().__init__(sqlite3.connect(path), commit_rows, statements_per_batch)
+
+    def create_table(self, ddl):
+        # SQLite has no IDENTITY, and writes a column foreign key as just REFERENCES
+        super().create_table(ddl.replace(' IDENTITY', '').replace(' FOREIGN KEY REFERENCES', ' REFERENCES'))
+
+    def _identity_insert(self, table, state):
+        pass
+
+
+def connect_from_env():
+    '''
+    Connect to SQL Server with the server, user, password and database settings of .env,
+    the same settings 03_flask_server.py uses
+    '''
+    # Only needed for --load, the script writers run without them
+    import pymssql
+    from dotenv import load_dotenv
+    load_dotenv()
+    return pymssql.connect(os.environ['server'], os.environ['user'], os.environ['password'], os.environ['database'])
+
+
+class QuotingConnection(object):
+    '''
+    Connection that runs every statement through the parameter substitution of pymssql and keeps the SQL,
+    without a server. check_parameters() loads through it to check the parameters pymssql is given.
+    '''
+    def __init__(self):
+        from pymssql import _mssql
+        self.substitute_params = _mssql.substitute_params
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement, params=()):
+        self.statements.append(self.substitute_params(statement, params).decode('utf-8'))
+
+    def executemany(self, statement, param_rows):
+        for params in param_rows:
+            self.execute(statement, params)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def check_parameters():
+    '''
+    Insert rows shaped like the ones the generator loads, tuples and the lists json.loads() gives the
+    --stream Games rows, through a DatabaseLoader on a QuotingConnection
+    :return: list of problems found, empty if pymssql took every statement
+    '''
+    conn = QuotingConnection()
+    loader = DatabaseLoader(conn, statements_per_batch=2)
+    loader.max_rows = 3
+    columns = ['Id', 'Event', 'Date', 'Moves']
+    rows = [(1, "O'Meien", '2007-07-19', b'\x01\x02'), [2, 'Cho Chikun', '2008-01-02', b'']] * 4 + \
+           [[9, 'Lee Sedol', '2009-03-04', b'\x00']]
+    problems = []
+    try:
+        loader.insert('Games', columns, rows)
+        loader.update('UPDATE Players SET CountryId = %s WHERE Id = %s', [[3, 1], (2, 2)])
+    except (TypeError, ValueError) as e:
+        problems.append(f'pymssql rejected the parameters: {e!r}')
+    inserts = [s for s in conn.statements if s.startswith('INSERT')]
+    if sum(s.count('),') + 1 for s in inserts) != len(rows):
+        problems.append(f'{len(rows)} rows sent in {len(inserts)} statements: {inserts}')
+    if not any("'O''Meien'" in s for s in inserts):
+        problems.append(f'quote not escaped: {inserts}')
+    if inserts and ('0x0102' not in inserts[0] or "'2008-01-02', 0x)" not in inserts[0]
+                    or not inserts[-1].endswith('0x00)')):
+        problems.append(f'Moves not sent as 0x literals: {inserts}')
+    return problems
+
+
+if __name__ == '__main__':
+    problems = check_parameters()
+    for problem in problems:
+        print(problem)
+    print(f'{len(problems)} problems')
+    exit(1 if problems else 0)
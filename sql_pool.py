@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class ConnectionPool(object):
+    '''
+    Bounded pool of database connections shared by all request threads.
+    At most max_size connections exist at once, a caller that finds all of them in use waits up to timeout seconds.
+    A connection that sat idle longer than health_check seconds is tested with SELECT 1 before it is handed out,
+    and replaced if the test fails.
+    '''
+    def __init__(self, connect, max_size=10, timeout=30.0, health_check=60.0):
+        '''
+        :param connect: function with no arguments returning a new DB-API connection
+        '''
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check = health_check
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        # Most recently used connections are handed out first, so idle ones age out of use
+        self.idle = deque()     # (connection, time returned)
+        self.opened = 0
+        self.acquires = 0
+        self.timeouts = 0
+        self.replaced = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self):
+        '''
+        :return: connection, to be handed back with release()
+        :raises PoolTimeout: no connection became free within timeout seconds
+        '''
+        wait_start = time.perf_counter()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise PoolTimeout(f'ConnectionPool.acquire(): no connection free after {self.timeout}s')
+        wait = time.perf_counter() - wait_start
+        with self.lock:
+            self.acquires += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            conn, returned = self.idle.pop() if self.idle else (None, None)
+        try:
+            if conn is not None and time.monotonic() - returned > self.health_check and not self._is_healthy(conn):
+                self._close(conn)
+                conn = None
+                with self.lock:
+                    self.opened -= 1
+                    self.replaced += 1
+            if conn is None:
+                conn = self.connect()
+                with self.lock:
+                    self.opened += 1
+        except Exception:
+            self.slots.release()
+            raise
+        return conn
+
+    def release(self, conn, broken=False):
+        '''
+        Hand a connection back to the pool
+        :param broken: the connection failed during use, close it instead of keeping it
+        '''
+        if broken:
+            self._close(conn)
+            with self.lock:
+                self.opened -= 1
+        else:
+            with self.lock:
+                self.idle.append((conn, time.monotonic()))
+        self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                max_size=self.max_size,
+                open=self.opened,
+                idle=len(self.idle),
+                in_use=self.opened - len(self.idle),
+                acquires=self.acquires,
+                timeouts=self.timeouts,
+                replaced=self.replaced,
+                wait_total_ms=round(1000 * self.wait_total, 3),
+                wait_avg_ms=round(1000 * self.wait_total / max(self.acquires, 1), 3),
+                wait_max_ms=round(1000 * self.wait_max, 3),
+            )
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass